@@ -0,0 +1,70 @@
+##########################################################################################
+# LOSBenchmark                                                                           #
+# Measures how fast LOSSerialTool is, using synthetic images from LOSImageGenerator.     #
+# For each collection size, it times viewing the status of every image, patching them,   #
+# unpatching them, and deserializing them and clearing their bozo bits.                 #
+##########################################################################################
+
+import os
+import io
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+
+import LOSSerialTool
+import LOSImageGenerator
+
+# The runs that get timed for each collection, in order. Each one works on the images as the run before it left them.
+scenarios = [
+    ('status', []),
+    ('patch', ['-patch', '1234']),
+    ('unpatch', ['-unpatch']),
+    ('deserialize/bozo', ['-deserialize', '-clearbozo']),
+]
+
+# Times a single run of LOSSerialTool over a directory of images, throwing away everything that it prints.
+# Returns the number of seconds that it took.
+def timeRun(directory, arguments):
+    startTime = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        LOSSerialTool.main(arguments + [directory])
+    return time.perf_counter() - startTime
+
+# Sets up argparse with all our command line arguments.
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Measures how fast LOSSerialTool is on collections of synthetic LOS disk images.", allow_abbrev=False)
+    parser.add_argument('-sizes', metavar='counts', default='10,1000,10000', help='A comma-separated list of how many images to use in each collection. Defaults to 10,1000,10000.')
+    parser.add_argument('-blocks', metavar='blocks', type=int, default=800, help='How many 512-byte blocks each image has. Defaults to 800, the size of a 400K floppy.')
+    parser.add_argument('-jobs', metavar='count', type=int, default=1, help='Passed along to LOSSerialTool. Defaults to 1.')
+    parser.add_argument('-dir', metavar='directory', help='Where to put the images. Defaults to a temporary directory, which gets deleted afterwards.')
+    parser.add_argument('-seed', metavar='seed', type=int, default=0, help='The seed for the image generator. Defaults to 0.')
+    args = parser.parse_args()
+    try:
+        args.sizes = [int(size) for size in args.sizes.split(',')]
+    except ValueError:
+        parser.error("Option -sizes must be a comma-separated list of numbers!")
+    if min(args.sizes) < 1:
+        parser.error("Option -sizes can only contain positive numbers!")
+    return args
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    baseDirectory = args.dir
+    if baseDirectory is None:
+        baseDirectory = tempfile.mkdtemp(prefix='LOSBenchmark-')
+    try:
+        print('images  run                  seconds    images/s        MB/s')
+        for size in args.sizes:
+            # Every collection gets its own freshly-made directory of images, and making them doesn't count towards the times.
+            directory = os.path.join(baseDirectory, str(size))
+            shutil.rmtree(directory, ignore_errors=True)
+            images, total = LOSImageGenerator.generate(directory, size, args.blocks, args.seed)
+            for name, arguments in scenarios:
+                seconds = timeRun(directory, arguments + ['-jobs', str(args.jobs)])
+                print(str(size).rjust(6) + '  ' + name.ljust(18) + f'{seconds:>10.3f}{size / seconds:>12.1f}{total / 1000000 / seconds:>12.1f}')
+            shutil.rmtree(directory, ignore_errors=True)
+    finally:
+        if args.dir is None:
+            shutil.rmtree(baseDirectory, ignore_errors=True)
@@ -0,0 +1,244 @@
+##########################################################################################
+# LOSImageGenerator                                                                      #
+# Builds synthetic LOS disk images for testing and benchmarking LOSSerialTool, so that  #
+# nobody needs a pile of real (copyrighted) disk images to measure how fast it is.       #
+# The images cover every kind of disk that LOSSerialTool knows how to deal with.         #
+##########################################################################################
+
+import os
+import random
+import struct
+import argparse
+
+import LOSSerialTool
+from LOSSerialTool import originalRoutine, patchPreSN, patchPostSN, dc42HeaderSize, dc42SectorSize, dc42Checksum, mddfFileID, catalogFileID
+
+# Where things go in the synthetic images. These are the same places that they live on real disks, so that raw images (which LOSSerialTool has to search heuristically) work too.
+# Tool entries have to be before 0xA000, installer strings between 0x3000 and 0x4000, and "LisaGuide" before 0xE000.
+decoyEntryOffset = 0x8000
+toolEntryOffset = 0x9000
+officeOffset = 0x3100
+lisaGuideOffset = 0x5000
+routineOffset = 0x20000
+routineSpacing = 0x1000
+mddfBlock = 20
+
+# Every kind of disk that we know how to make. Each one is a tuple of the disk type and its settings.
+# Tool disks come in every combination of '}OBJ' or '}obj', '{T' or '{t', serialized or not, and bozo bits on, off, or with just the first byte off.
+diskKinds = []
+for upperCase in (False, True):
+    for lowerCaseT in (False, True):
+        for serialized in (False, True):
+            for bozo in (b'\x01\x01', b'\x00\x00', b'\x00\x01'):
+                diskKinds.append(('tool', upperCase, lowerCaseT, serialized, bozo))
+diskKinds.append(('lisaWrite2',))
+diskKinds.append(('installDisk1', False))
+diskKinds.append(('installDisk1', True))
+for number in '2345':
+    diskKinds.append(('installDisk', number))
+diskKinds.append(('lisaGuide',))
+diskKinds.append(('junk',))
+
+# How many copies of the SN routine each image gets, and which routine: none at all, one or several of the original, one or several of the patched one, or a mix of both.
+routineKinds = [(0, 0), (1, 0), (4, 0), (0, 1), (0, 4), (2, 2)]
+
+# Raw images, Disk Copy 4.2 images with blank tags (so that LOSSerialTool has to fall back to its heuristics), and Disk Copy 4.2 images with tags that describe a Lisa filesystem.
+imageFormats = ['raw', 'dc42', 'dc42fs']
+
+# Makes a short name for a disk kind, routine kind, and image format, which gets used as part of the image's filename.
+def describe(diskKind, routineKind, imageFormat):
+    name = diskKind[0]
+    if diskKind[0] == 'tool':
+        name += '-' + ('OBJ' if diskKind[1] else 'obj') + '-' + ('t' if diskKind[2] else 'T')
+        name += '-' + ('serialized' if diskKind[3] else 'clean') + '-bozo' + diskKind[4].hex()
+    elif diskKind[0] == 'installDisk1':
+        name += '-' + ('serialized' if diskKind[1] else 'clean')
+    elif diskKind[0] == 'installDisk':
+        name += diskKind[1]
+    return name + '-orig' + str(routineKind[0]) + '-patched' + str(routineKind[1]) + '-' + imageFormat
+
+# Builds the data area of a synthetic disk with the given number of 512-byte blocks.
+# Returns the data and the list of blocks that hold the volume catalog, which only matters if the image will get filesystem tags.
+def buildData(diskKind, routineKind, blocks, rng):
+    # Fill the disk with random junk, so that the scan has as much to wade through as it would on a real disk.
+    # Curly braces are left out so that the junk can't ever look like a tool entry.
+    data = bytearray(rng.randbytes(blocks * dc42SectorSize).translate(bytes.maketrans(b'{}', b'\x00\x00')))
+    catalogBlocks = []
+    if diskKind[0] in ('tool', 'lisaWrite2'):
+        if diskKind[0] == 'tool':
+            upperCase, lowerCaseT, serialized, bozo = diskKind[1:]
+        else:
+            upperCase, lowerCaseT, serialized, bozo = False, False, False, b'\x01\x01'
+        toolNumber = bytes(str(rng.randint(1, 9999)), 'ascii')
+        entry = (b'{t' if lowerCaseT else b'{T') + toolNumber + (b'}OBJ' if upperCase else b'}obj')
+        # An earlier entry for the same tool, like on real disks, and then the entry that actually holds the serial number and bozo bits.
+        putBytes(data, decoyEntryOffset, b'{T' + toolNumber + b'}OBJ')
+        putBytes(data, toolEntryOffset, entry)
+        serial = rng.randint(1, 0xFFFFFF) if serialized else 0
+        putBytes(data, toolEntryOffset + 65, serial.to_bytes(4, byteorder='big'))
+        putBytes(data, toolEntryOffset + 71, bozo)
+        # The next catalog entry follows several hundred bytes later on normal tool disks, but right away on the LisaWrite 2 disk.
+        if diskKind[0] == 'lisaWrite2':
+            putBytes(data, toolEntryOffset + 60, b'{T' + toolNumber + b'}dict')
+        else:
+            putBytes(data, toolEntryOffset + 600, b'{T' + toolNumber + b'}tool')
+        catalogBlocks = range(decoyEntryOffset // dc42SectorSize, (toolEntryOffset + 1024) // dc42SectorSize)
+    elif diskKind[0] in ('installDisk1', 'installDisk'):
+        number = b'1' if diskKind[0] == 'installDisk1' else bytes(diskKind[1], 'ascii')
+        # The installers mention themselves in a few places, but only the one between 0x3000 and 0x4000 holds the serial number.
+        putBytes(data, 0x1000, b'Office System ' + number)
+        putBytes(data, officeOffset, b'Office System ' + number)
+        if diskKind[0] == 'installDisk1':
+            serial = rng.randint(1, 0xFFFFFF) if diskKind[1] else 0
+            putBytes(data, officeOffset + 191, serial.to_bytes(4, byteorder='big'))
+        # Installers have tool entries in their catalogs too, which is why LOSSerialTool checks for the installer strings before deciding that it's a tool disk.
+        putBytes(data, decoyEntryOffset, b'{T9}obj')
+        catalogBlocks = list(range(officeOffset // dc42SectorSize, officeOffset // dc42SectorSize + 2)) + [decoyEntryOffset // dc42SectorSize]
+    elif diskKind[0] == 'lisaGuide':
+        putBytes(data, lisaGuideOffset, b'LisaGuide')
+    # Then add the SN routines, originals first.
+    position = routineOffset
+    for copy in range(routineKind[0]):
+        putBytes(data, position, originalRoutine)
+        position += routineSpacing
+    serial = rng.randint(0, 0xFFFFFF)
+    for copy in range(routineKind[1]):
+        putBytes(data, position, patchPreSN + serial.to_bytes(3, byteorder='big') + patchPostSN)
+        position += routineSpacing
+    return data, catalogBlocks
+
+# Builds the tags for a disk, marking the MDDF and the catalog blocks with their file IDs so that LOSSerialTool can find them.
+# The MDDF also gets a volume name, which means that the data has to be changed too.
+def buildTags(data, catalogBlocks, blocks, volumeName):
+    tags = bytearray(blocks * 12)
+    if not catalogBlocks:
+        return tags
+    struct.pack_into('>H', tags, mddfBlock * 12 + 4, mddfFileID)
+    mddf = mddfBlock * dc42SectorSize
+    data[mddf:(mddf + dc42SectorSize)] = bytes(dc42SectorSize)
+    data[mddf + 12] = len(volumeName)
+    putBytes(data, mddf + 13, volumeName)
+    for block in catalogBlocks:
+        struct.pack_into('>H', tags, block * 12 + 4, catalogFileID)
+    return tags
+
+# Wraps a disk's data and tags up into a Disk Copy 4.2 image, with correct checksums.
+def makeDiskCopy(data, tags, name):
+    header = bytearray(dc42HeaderSize)
+    header[0] = len(name)
+    header[1:(1 + len(name))] = name
+    struct.pack_into('>IIII', header, 0x40, len(data), len(tags), dc42Checksum(data, 0), dc42Checksum(tags[12:], 0))
+    # A 400K disk and the magic number.
+    header[0x50] = 0
+    header[0x51] = 0x02
+    header[0x52:0x54] = b'\x01\x00'
+    return bytes(header) + bytes(data) + bytes(tags)
+
+# Copies some bytes into the data at the given offset.
+def putBytes(data, offset, value):
+    data[offset:(offset + len(value))] = value
+
+# Returns every combination of disk kind, routine kind, and image format, in a shuffled (but repeatable) order, so that even a handful of images covers a good mix.
+def allCombinations(seed):
+    combinations = [(diskKind, routineKind, imageFormat) for diskKind in diskKinds for routineKind in routineKinds for imageFormat in imageFormats]
+    random.Random(seed).shuffle(combinations)
+    return combinations
+
+# Builds the data of a hard disk with a whole LOS installation's worth of tools on it, for checking -harddisk.
+# One of the tools is LisaWrite 2 (with the dictionary's entry right after it), and the last tool's entry is the very last thing on the disk that looks like one, so nothing follows it.
+# Returns the data and the list of (tool number, serial number, bozo bits, whether it's LisaWrite 2) that LOSSerialTool should find, in order.
+def buildHardDisk(tools, blocks, rng):
+    data = bytearray(rng.randbytes(blocks * dc42SectorSize).translate(bytes.maketrans(b'{}', b'\x00\x00')))
+    numbers = rng.sample(range(1, 10000), tools)
+    lisaWrite2 = tools // 2
+    expected = []
+    position = decoyEntryOffset
+    for number, toolNumber in enumerate(numbers):
+        toolNumber = bytes(str(toolNumber), 'ascii')
+        # Some tools have an earlier entry too, just like on the floppies.
+        if number % 3 == 0:
+            putBytes(data, position, b'{T' + toolNumber + b'}OBJ')
+            position += 300
+        putBytes(data, position, b'{T' + toolNumber + b'}obj')
+        serial = rng.choice([0, rng.randint(1, 0xFFFFFF)])
+        bozo = rng.choice([b'\x01\x01', b'\x00\x00', b'\x00\x01'])
+        putBytes(data, position + 65, serial.to_bytes(4, byteorder='big'))
+        putBytes(data, position + 71, bozo)
+        # The dictionary's entry overlaps where LisaWrite 2's serial number would be, so take the serial number and bozo bits from the finished entry.
+        if number == lisaWrite2:
+            putBytes(data, position + 60, b'{T' + toolNumber + b'}dict')
+        serial = int.from_bytes(data[(position + 65):(position + 69)], byteorder='big')
+        expected.append((str(toolNumber, 'ascii'), serial, data[(position + 71):(position + 73)] == b'\x01\x01', number == lisaWrite2))
+        position += 600
+    putBytes(data, routineOffset, originalRoutine)
+    return data, expected
+
+# Makes sure that LOSSerialTool finds every tool on a synthetic hard disk, as both a raw image and a Disk Copy 4.2 one, with the right serial number and bozo bits, and with only the LisaWrite 2 entry marked as LisaWrite 2.
+# Returns a list of everything that came out wrong, which is empty if it all checks out.
+def checkHardDisk(tools=12, blocks=800, seed=0):
+    data, expected = buildHardDisk(tools, blocks, random.Random(seed))
+    problems = []
+    for imageFormat, contents in (('raw', bytes(data)), ('dc42', makeDiskCopy(data, bytearray(blocks * 12), b'Hard Disk'))):
+        report = LOSSerialTool.analyze(contents)
+        found = [(toolNumber, serial, bozo, lisaWrite2) for offset, toolNumber, serial, bozo, lisaWrite2 in report.toolEntries]
+        if found != expected:
+            problems.append(imageFormat + ': expected ' + str(expected) + ' but found ' + str(found))
+    return problems
+
+# Writes count synthetic images to directory, working through all of the combinations in turn. Each image has the given number of 512-byte blocks.
+# Returns the list of images that were written, along with the total number of bytes in them.
+def generate(directory, count, blocks=800, seed=0):
+    os.makedirs(directory, exist_ok=True)
+    combinations = allCombinations(seed)
+    rng = random.Random(seed)
+    images = []
+    total = 0
+    for number in range(count):
+        diskKind, routineKind, imageFormat = combinations[number % len(combinations)]
+        name = str(number).zfill(5) + '-' + describe(diskKind, routineKind, imageFormat)
+        data, catalogBlocks = buildData(diskKind, routineKind, blocks, rng)
+        if imageFormat == 'raw':
+            contents = bytes(data)
+            fname = os.path.join(directory, name + '.image')
+        else:
+            if imageFormat == 'dc42fs':
+                tags = buildTags(data, catalogBlocks, blocks, bytes(diskKind[0], 'ascii'))
+            else:
+                tags = bytearray(blocks * 12)
+            contents = makeDiskCopy(data, tags, bytes(name[:63], 'ascii'))
+            fname = os.path.join(directory, name + '.dc42')
+        with open(fname, 'wb') as image:
+            image.write(contents)
+        images.append(fname)
+        total += len(contents)
+    return images, total
+
+# Sets up argparse with all our command line arguments.
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Builds synthetic LOS disk images that cover everything LOSSerialTool knows how to handle.", allow_abbrev=False)
+    parser.add_argument('directory', nargs='?', help='The directory to write the images to. It gets created if it doesn\'t exist.')
+    parser.add_argument('-count', metavar='images', type=int, default=len(diskKinds) * len(routineKinds) * len(imageFormats), help='How many images to make. Defaults to one of every combination (' + str(len(diskKinds) * len(routineKinds) * len(imageFormats)) + ').')
+    parser.add_argument('-blocks', metavar='blocks', type=int, default=800, help='How many 512-byte blocks each image has. Defaults to 800, the size of a 400K floppy.')
+    parser.add_argument('-seed', metavar='seed', type=int, default=0, help='The seed for the random number generator, so that the same images can be made again. Defaults to 0.')
+    parser.add_argument('-check', action='store_true', help='Instead of writing any images, build a hard disk with lots of tools in memory and make sure that LOSSerialTool finds every one of them correctly.')
+    args = parser.parse_args()
+    if args.directory is None and not args.check:
+        parser.error("A directory to write the images to is needed, unless -check is given!")
+    # Everything we put on the disk has to fit, and the routines start at 0x20000.
+    minimumBlocks = (routineOffset + 4 * routineSpacing) // dc42SectorSize
+    if args.blocks < minimumBlocks:
+        parser.error("Option -blocks must be at least " + str(minimumBlocks) + "!")
+    if args.count < 0:
+        parser.error("Option -count can't be negative!")
+    return args
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    if args.check:
+        problems = checkHardDisk(blocks=args.blocks, seed=args.seed)
+        for problem in problems:
+            print(problem)
+        print(('Found ' + str(len(problems)) + ' problem(s).') if problems else 'Every tool was found correctly.')
+        raise SystemExit(1 if problems else 0)
+    images, total = generate(args.directory, args.count, args.blocks, args.seed)
+    print('Wrote ' + str(len(images)) + ' image(s) (' + str(total) + ' bytes) to ' + args.directory + '.')
@@ -7,8 +7,19 @@
 # May 2, 2024                                                                         #
 ##########################################################################################
 
+import io
 import os
+import re
+import copy
+import glob
+import json
+import time
+import struct
+import hashlib
+import bisect
+import shutil
 import argparse
+import itertools
 
 class Color:
     PURPLE = '\033[95m'
@@ -39,26 +50,2762 @@ officeString = bytes('Office System 1', 'ascii')
 officeOther = bytes('Office System ', 'ascii')
 lisaGuide = bytes('LisaGuide', 'ascii')
 
-index = 0
-prevIndex = 0
-lowerCaseIndex = 0
-counter = 0
-newContents = 0
-oldSerial = 0
-toolNumber = 0
-oldBozo = True
-isTool = False
-isOfficeSystem = False
-isOtherOffice = False
-
-# Saves the patched data back to the file once we're done.
-def saveFile(filename):
-    with open(filename, 'wb') as image:
-        image.write(newContents)
+# Every fixed string that we care about, mapped to the name that it gets in the match table.
+# None of these strings can overlap with one another (or with the SN routines), so the scan can look for all of them at once.
+signatureNames = {
+    toolString: 'toolString',
+    toolStringLowerCase: 'toolStringLowerCase',
+    toolStringShort: 'toolStringShort',
+    toolStringShortLowerCase: 'toolStringShortLowerCase',
+    lisaGuide: 'lisaGuide',
+}
+
+# Different LOS releases can have slightly different versions of the SN routine (with an address that moved, for instance), so the routines are kept in a database of signatures.
+# Each signature has an original routine and the patched version of it, written in hex with '??' for any byte that can be different from one disk to the next.
+# The serial number goes in the 3 bytes at serialOffset in the patched version, and is always treated as '??'.
+# Bytes that are '??' in a signature are left alone when patching or unpatching, so that whatever was there on the disk stays the same.
+class RoutineSignature:
+    def __init__(self, name, original, patched, serialOffset):
+        self.name = name
+        self.original, self.originalMask = parseMaskedHex(original)
+        self.patched, self.patchedMask = parseMaskedHex(patched)
+        self.serialOffset = serialOffset
+        self.length = len(self.original)
+        if len(self.patched) != self.length:
+            raise ValueError('signature ' + name + ': the original and patched routines have to be the same length')
+        if serialOffset < routineAnchorLength or serialOffset + 3 > self.length:
+            raise ValueError('signature ' + name + ': the serial number has to fit inside the patched routine, after the first ' + str(routineAnchorLength) + ' bytes')
+        # Both routines have to start with some fixed bytes, since that's what the scan looks for.
+        for mask in (self.originalMask, self.patchedMask):
+            if mask[:routineAnchorLength] != b'\xff' * routineAnchorLength:
+                raise ValueError('signature ' + name + ': the first ' + str(routineAnchorLength) + ' bytes of each routine can\'t be wildcards')
+        self.patchedMask[serialOffset:(serialOffset + 3)] = bytes(3)
+        self.patched[serialOffset:(serialOffset + 3)] = bytes(3)
+        # Comparing with a mask is done on the whole routine at once, as one big integer, which is a lot faster than going byte by byte.
+        self.originalValue = int.from_bytes(self.original, 'big')
+        self.originalBits = int.from_bytes(self.originalMask, 'big')
+        self.patchedValue = int.from_bytes(self.patched, 'big')
+        self.patchedBits = int.from_bytes(self.patchedMask, 'big')
+        # A patched routine is recognized by the part before the serial number alone, so that we can still tell the user about patches that got damaged after that.
+        self.prefixValue = int.from_bytes(self.patched[:serialOffset], 'big')
+        self.prefixBits = int.from_bytes(self.patchedMask[:serialOffset], 'big')
+
+    # Checks whether some bytes from the image are this original routine.
+    def matchesOriginal(self, data):
+        return len(data) == self.length and int.from_bytes(data, 'big') & self.originalBits == self.originalValue
+
+    # Checks whether some bytes from the image start like this patched routine (everything up to the serial number).
+    def matchesPatchedPrefix(self, data):
+        return len(data) >= self.serialOffset and int.from_bytes(data[:self.serialOffset], 'big') & self.prefixBits == self.prefixValue
+
+    # Checks whether some bytes from the image are this whole patched routine, with any serial number.
+    def matchesPatched(self, data):
+        return len(data) == self.length and int.from_bytes(data, 'big') & self.patchedBits == self.patchedValue
+
+    # Returns the (offset, bytes) edits that turn the routine at index into the patched routine with the given serial number.
+    def patchEdits(self, index, serial):
+        return maskedEdits(index, self.patched, self.patchedMask) + [(index + self.serialOffset, serial.to_bytes(3, byteorder='big'))]
+
+    # Returns the (offset, bytes) edits that turn the routine at index back into the original routine.
+    def unpatchEdits(self, index):
+        return maskedEdits(index, self.original, self.originalMask)
+
+    # Converts the signature back to the form that it's loaded from.
+    def toDict(self):
+        return {'name': self.name, 'original': maskedHex(self.original, self.originalMask), 'patched': maskedHex(self.patched, self.patchedMask), 'serialOffset': self.serialOffset}
+
+# Turns hex with '??' wildcards into the bytes and a mask that has 0xFF for every byte that matters and 0x00 for every wildcard. Spaces are ignored.
+def parseMaskedHex(text):
+    text = ''.join(text.split())
+    if len(text) % 2 != 0:
+        raise ValueError('signature hex has to have an even number of digits')
+    data = bytearray()
+    mask = bytearray()
+    for position in range(0, len(text), 2):
+        pair = text[position:(position + 2)]
+        if pair == '??':
+            data.append(0)
+            mask.append(0)
+        else:
+            data.append(int(pair, 16))
+            mask.append(0xFF)
+    return data, mask
+
+# Turns bytes and a mask back into hex with '??' wildcards.
+def maskedHex(data, mask):
+    text = ''
+    for position in range(len(data)):
+        if mask[position] == 0:
+            text += '??'
+        else:
+            text += '%02X' % data[position]
+    return text
+
+# Returns the edits that write every run of fixed bytes in a masked routine to the image at index, skipping the wildcards.
+def maskedEdits(index, data, mask):
+    edits = []
+    start = -1
+    for position in range(len(data) + 1):
+        fixed = position < len(data) and mask[position] != 0
+        if fixed and start == -1:
+            start = position
+        elif not fixed and start != -1:
+            edits.append((index + start, bytes(data[start:position])))
+            start = -1
+    return edits
+
+# How many bytes at the start of each routine the scan looks for. Every routine that starts with the same bytes shares the same entry in the scan patterns,
+# so adding more signatures (which mostly start the same way) doesn't make the scan any slower; only the handful of places where those bytes turn up have to be checked against each signature.
+routineAnchorLength = 4
+
+# The name of the signature for the routine that this program was originally written for.
+defaultRoutineName = 'LOS 3'
+
+# Every routine signature that we know about, by name, and the signatures that go with each set of starting bytes, in the order that they were added.
+routineSignatures = {}
+routineAnchors = {}
+
+# Adds a routine signature to the database and rebuilds the scan patterns so that it gets found. A signature with the same name as an existing one replaces it.
+def addSignature(name, original, patched, serialOffset):
+    signature = RoutineSignature(name, original, patched, serialOffset)
+    if name in routineSignatures:
+        for anchor in list(routineAnchors):
+            routineAnchors[anchor] = [existing for existing in routineAnchors[anchor] if existing.name != name]
+            if not routineAnchors[anchor]:
+                del routineAnchors[anchor]
+    routineSignatures[name] = signature
+    for routine in (signature.original, signature.patched):
+        signatures = routineAnchors.setdefault(bytes(routine[:routineAnchorLength]), [])
+        if signature not in signatures:
+            signatures.append(signature)
+    compileScanPattern()
+    return signature
+
+# Loads routine signatures from a JSON file: a list of objects with "name", "original", "patched", and "serialOffset" keys, just like the arguments to addSignature.
+# Each file only gets loaded once, no matter how many times this is called.
+def loadSignatures(path):
+    if path in loadedSignatureFiles:
+        return
+    with open(path, 'r') as signatureFile:
+        entries = json.load(signatureFile)
+    for entry in entries:
+        addSignature(entry['name'], entry['original'], entry['patched'], entry['serialOffset'])
+    loadedSignatureFiles.add(path)
+
+loadedSignatureFiles = set()
+
+# Returns a short hash of every routine signature in the database, so that cached analysis results can tell whether they were made with the same signatures.
+def signatureFingerprint():
+    definitions = json.dumps([routineSignatures[name].toDict() for name in sorted(routineSignatures)])
+    return hashlib.blake2b(bytes(definitions, 'ascii'), digest_size=8).hexdigest()
+
+# Compiles every signature into the patterns that the scan looks for: the starting bytes of every routine, then the fixed strings.
+# Strings that start with the same byte share a single pattern, so that the regex engine can skip straight to the places where that byte turns up; a pattern whose strings start
+# with different bytes has to stop and check every position, which is many times slower. The starting bytes of every routine almost always begin with the same byte,
+# so every routine signature gets found in a single pass, however many there are.
+# "Office System " gets special treatment: the digit after it (if any) is matched too, so that "Office System 1" through "Office System 5" come out of the same match.
+# Note that we don't use named groups here; they stop the regex engine from skipping ahead to the first byte of a possible match, which makes the scan about 10x slower.
+def compileScanPattern():
+    global scanPatterns, scanOverlap, currentFingerprint
+    strings = list(routineAnchors) + list(signatureNames) + [officeOther]
+    groups = {}
+    for sig in strings:
+        groups.setdefault(sig[:1], []).append(re.escape(sig) + (b'[0-9]?' if sig == officeOther else b''))
+    scanPatterns = [re.compile(b'|'.join(group)) for group in groups.values()]
+    # The longest match that the patterns can make. When we scan an image in chunks, each chunk gets extended by this much so that no match can get cut in half.
+    # The rest of each routine gets checked against the image directly, so it doesn't need to fit in the chunk.
+    scanOverlap = max([len(sig) for sig in strings] + [len(officeOther) + 1])
+    currentFingerprint = signatureFingerprint()
+
+addSignature(defaultRoutineName, originalRoutine.hex(), patchPreSN.hex() + '??????' + patchPostSN.hex(), len(patchPreSN))
+
+# What -profile counts for each image: files opened, reads and the bytes they returned, searches (each pass of a pattern over part of the image) and the bytes that they covered all together, signature matches,
+# copies of parts of the image made while working out changes, and writes and the bytes they wrote.
+profileCounters = ['filesOpened', 'reads', 'bytesRead', 'searches', 'bytesScanned', 'matches', 'sliceCopies', 'writes', 'bytesWritten']
+
+# And the phases that it times: reading the image, scanning and analyzing it, planning the changes, and writing them.
+profilePhases = ['read', 'scan', 'plan', 'write']
+
+# The counters and timings for a single image, for -profile.
+class Profile:
+    def __init__(self):
+        self.counters = {name: 0 for name in profileCounters}
+        self.seconds = {name: 0.0 for name in profilePhases}
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+    def toDict(self):
+        return {'counters': dict(self.counters), 'seconds': {name: round(value, 6) for name, value in self.seconds.items()}}
+
+# The profile of the image that's being worked on right now, or None if we're not profiling.
+# Everything that gets counted checks for None first, so that when profiling is off, it costs next to nothing.
+profile = None
+
+# Starts profiling a new image, if the options ask for it.
+def startProfile(options):
+    global profile
+    profile = Profile() if options.profile else None
+
+# Stops profiling the current image, and returns its profile as a dictionary, or None if we weren't profiling.
+def finishProfile():
+    global profile
+    stats = None if profile is None else profile.toDict()
+    profile = None
+    return stats
+
+# Searches the image for every signature (one pass for each different first byte that they start with) and returns a match table: a dictionary that maps each signature name to a sorted list of every offset where it was found.
+# "Office System N" matches are also filed under 'officeSystemN' so that we don't have to go looking for each number separately.
+# If start and end are given, only that part of the image is searched, but the offsets in the table are still from the start of the file.
+# If chunkSize is given, the image is read and scanned a chunk at a time instead of all at once, which keeps memory use down for big hard disk images.
+# The contents only need to support slicing in that case, so they can be an ImageReader that reads each chunk from the file as it's needed.
+def scanImage(contents, start=0, end=None, chunkSize=None):
+    if end is None:
+        end = len(contents)
+    table = {name: [] for name in signatureNames.values()}
+    table['originalRoutine'] = []
+    table['patchedRoutine'] = []
+    # The name of the signature that each routine matched, by offset.
+    table['routineNames'] = {}
+    table['officeOther'] = []
+    for digit in '0123456789':
+        table['officeSystem' + digit] = []
+    if chunkSize is None:
+        for offset, found in findSignatures(contents, start, end, end):
+            recordMatch(table, contents, end, offset, found)
+        return table
+    position = start
+    while position < end:
+        # Read this chunk along with enough of the next one to finish any match that starts near the end of this one.
+        # Matches that start in the overlap belong to the next chunk, which will find them again.
+        windowEnd = min(end, position + chunkSize + scanOverlap)
+        window = contents[position:windowEnd]
+        for offset, found in findSignatures(window, 0, len(window), chunkSize):
+            recordMatch(table, contents, end, position + offset, found)
+        position += chunkSize
+    return table
+
+# Finds every signature in contents between start and end, and returns an (offset, string) pair for each one that starts before stop, in the order that they turn up.
+# Each of the scan patterns makes one pass; there's one for each different first byte, which is only a handful, no matter how many signatures there are.
+def findSignatures(contents, start, end, stop):
+    matches = []
+    for pattern in scanPatterns:
+        if profile is not None:
+            profile.count('searches')
+            profile.count('bytesScanned', end - start)
+        for match in pattern.finditer(contents, start, end):
+            if match.start() >= stop:
+                break
+            matches.append((match.start(), match.group()))
+    matches.sort()
+    return matches
+
+# Files a single match from the scan into the match table.
+# If it's the start of an SN routine, the rest of the routine (up to end) gets checked against each of the signatures that start the same way, and the first one that matches wins.
+def recordMatch(table, contents, end, offset, found):
+    if profile is not None:
+        profile.count('matches')
+    signatures = routineAnchors.get(found)
+    if signatures is not None:
+        data = contents[offset:min(end, offset + max([signature.length for signature in signatures]))]
+        for signature in signatures:
+            if signature.matchesOriginal(data[:signature.length]):
+                table['originalRoutine'].append(offset)
+            elif signature.matchesPatchedPrefix(data):
+                table['patchedRoutine'].append(offset)
+            else:
+                continue
+            table['routineNames'][offset] = signature.name
+            break
+        return
+    name = signatureNames.get(found)
+    if name is not None:
+        table[name].append(offset)
+    else:
+        # Anything that isn't in our dictionary has to be one of the "Office System" strings.
+        table['officeOther'].append(offset)
+        if len(found) > len(officeOther):
+            table['officeSystem' + chr(found[-1])].append(offset)
+
+# Gives slice access to an image file without reading the whole thing into memory. Every slice is read from the file with a positioned read when it's asked for.
+# This is what we use for images that are too big to comfortably read all at once. Anything that works on an image's contents using slices and indexing works on one of these too.
+# start and end restrict the reader to part of the file, with offsets counted from start.
+class ImageReader:
+    def __init__(self, image, chunkSize, start=0, end=None):
+        self.image = image
+        self.chunkSize = chunkSize
+        self.start = start
+        if end is None:
+            end = os.fstat(image.fileno()).st_size
+        self.end = end
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            low, high, step = key.indices(len(self))
+            if step != 1:
+                raise ValueError('ImageReader only supports contiguous slices')
+            return readAt(self.image, self.start + low, max(0, high - low))
+        if key < 0:
+            key += len(self)
+        if key < 0 or key >= len(self):
+            raise IndexError('ImageReader index out of range')
+        return readAt(self.image, self.start + key, 1)[0]
+
+    # Returns a reader for just part of this one, with offsets counted from the start of that part.
+    def window(self, start, end):
+        return ImageReader(self.image, self.chunkSize, self.start + start, self.start + end)
+
+# Reads length bytes from an open file starting at offset, without moving the file position if we can help it.
+def readAt(image, offset, length):
+    # os.pread isn't available on Windows, so fall back to seeking there.
+    if hasattr(os, 'pread'):
+        data = os.pread(image.fileno(), length, offset)
+    else:
+        image.seek(offset)
+        data = image.read(length)
+    if profile is not None:
+        profile.count('reads')
+        profile.count('bytesRead', len(data))
+    return data
+
+# Returns part of an image's contents without copying it: a memoryview for contents that are in memory, or a narrower ImageReader for ones that aren't.
+def viewOf(contents, start, end):
+    if isinstance(contents, ImageReader):
+        return contents.window(start, end)
+    return memoryview(contents)[start:end]
+
+# Returns the first offset in a sorted list that's at or after start, or -1 if there isn't one. Works just like contents.find(string, start).
+def firstAtOrAfter(offsets, start):
+    position = bisect.bisect_left(offsets, start)
+    if position == len(offsets):
+        return -1
+    return offsets[position]
+
+# Returns the last offset in a sorted list that's at or before limit, or -1 if there isn't one.
+def lastAtOrBefore(offsets, limit):
+    position = bisect.bisect_right(offsets, limit)
+    if position == 0:
+        return -1
+    return offsets[position - 1]
+
+# Returns the first offset in a sorted list that's strictly between low and high, or -1 if there isn't one.
+def firstBetween(offsets, low, high):
+    index = firstAtOrAfter(offsets, low + 1)
+    if index >= high:
+        return -1
+    return index
+
+# Looks up the tool entry (the '{TX}obj' string whose serial number and bozo bits we care about).
+# If we were able to parse the disk's filesystem, the entry comes straight out of the volume catalog. Otherwise, we fall back to looking for it in the match table.
+# Returns whether it looks like a tool disk and the index of the '{T' that starts the entry.
+def findToolEntry(table, volume=None):
+    if volume is not None:
+        # The last object file entry in the catalog is the one with the serialization info.
+        if volume.objectEntries:
+            index = volume.objectEntries[-1].offset
+        else:
+            return False, -1
+    else:
+        index = findToolEntryHeuristically(table)
+        if index is None:
+            return False, -1
+    # It's not a tool disk if it has any of the strings "Office System 1" through "Office System 5" anywhere in it.
+    # In that case, it's an OS installer disk. Some of the OS installers have tool strings that will confuse the above code, which is why we need this check!
+    for digit in '12345':
+        if table['officeSystem' + digit]:
+            return False, index
+    return True, index
+
+# Finds the tool entry on a disk whose filesystem we couldn't parse, by looking for the last tool string before 0xA000.
+# Returns the index of the '{T' that starts the entry, or None if there aren't any tool strings at all.
+def findToolEntryHeuristically(table):
+    # Find the last occurrance of each of the lowercase and uppercase tool strings, but only up to index 0xA000. Any occurrances after that aren't related to serialization info.
+    lowerCaseIndex = lastAtOrBefore(table['toolStringLowerCase'], 0xA000)
+    upperCaseIndex = lastAtOrBefore(table['toolString'], 0xA000)
+    # If neither was found, then it's probably not a tool disk.
+    if lowerCaseIndex == -1 and upperCaseIndex == -1:
+        return None
+    # Only the final occurrance of the tool string is the one with the serialization info, so pick whichever index is larger.
+    index = max(lowerCaseIndex, upperCaseIndex)
+    # The full tool number is {TX}obj, where X is a number from 0 to something really big, so we were just searching for the rear end of this.
+    # Since we don't know the size of the number, back up by 15 and find the closest '{T' or '{t' from there.
+    # The serial number is indexed from the start of the tool number, which is why we need to know where it is!
+    index -= 15
+    lowerCaseIndex = firstAtOrAfter(table['toolStringShortLowerCase'], index)
+    index = firstAtOrAfter(table['toolStringShort'], index)
+    if (lowerCaseIndex < index and lowerCaseIndex > -1) or index == -1:
+        index = lowerCaseIndex
+    return index
+
+# Finds the object file entry of every tool on the disk, for hard disk images that have a whole LOS installation on them.
+# If we were able to parse the disk's filesystem, the entries come straight out of the catalog index. Otherwise, each tool string in the match table gets paired up with the '{T' that starts it.
+# A tool can have more than one entry, and just like on a tool disk, the last one is the one with the serialization info.
+# Returns a list of (offset, tool number, serial number, bozo bits, whether it's LisaWrite 2) for each tool, in the order that they appear on disk.
+def findToolEntries(contents, table, volume=None):
+    if volume is not None:
+        entries = [(entry.offset, entry.toolNumber) for entry in volume.objectEntries]
+    else:
+        entries = []
+        starts = sorted(table['toolStringShort'] + table['toolStringShortLowerCase'])
+        for end in sorted(table['toolString'] + table['toolStringLowerCase']):
+            # There has to be at least one digit between the '{T' and the tool string, and tool numbers are never anywhere near 13 digits long.
+            start = lastAtOrBefore(starts, end - 3)
+            if start == -1 or end - start > 15:
+                continue
+            number = bytes(contents[(start + 2):end])
+            if number.isdigit():
+                entries.append((start, str(number, 'ascii')))
+    lastEntries = {}
+    for offset, toolNumber in entries:
+        lastEntries[toolNumber] = offset
+    toolEntries = []
+    for toolNumber, offset in sorted(lastEntries.items(), key=lambda item: item[1]):
+        # The serial number and bozo bits are in the same places as in analyze.
+        serial = int.from_bytes(contents[(offset + 65):(offset + 69)], 'big')
+        bozo = contents[(offset + 71):(offset + 73)] == b'\x01\x01'
+        toolEntries.append((offset, toolNumber, serial, bozo, isLisaWrite2(table, offset)))
+    return toolEntries
+
+# Checks whether the tool entry at index is the LisaWrite 2 disk, which is just the dictionary and has no valid serialization info.
+# We know it is if another tool string follows soon (within 130 bytes) after the one we found; normal disks have several hundred bytes in between tool strings.
+# If nothing follows it at all (like the last tool on a hard disk), it's not LisaWrite 2.
+def isLisaWrite2(table, index):
+    following = firstAtOrAfter(table['toolStringShort'], index + len(toolStringShort))
+    return following != -1 and following - index < 130
+
+# Looks up the installer disk strings in the match table.
+# If we were able to parse the disk's filesystem, only strings inside the MDDF and the volume catalog count. Otherwise, they have to be in the range where they normally live.
+# Returns whether it's LOS install disk 1, whether it's one of the other install disks, and the index of the "Office System" string that was found.
+def findOfficeSystem(table, volume=None):
+    if volume is not None:
+        index = volume.firstWithin(table['officeSystem1'])
+        if index > -1:
+            return True, False, index
+        index = volume.firstWithin(table['officeOther'])
+        return False, index > -1, index
+    # Only the "Office System 1" string that's between 0x3000 and 0x4000 contains serialization, so that's the one we want.
+    index = firstBetween(table['officeSystem1'], 0x3000, 0x4000)
+    if index > -1:
+        return True, False, index
+    # If that wasn't found, then look for the simple string "Office System" in the same range.
+    index = firstBetween(table['officeOther'], 0x3000, 0x4000)
+    return False, index > -1, index
+
+# Checks for the text "LisaGuide" between indices 0x0000 and 0xE000.
+def isLisaGuide(table):
+    return len(table['lisaGuide']) > 0 and table['lisaGuide'][0] < 0xE000 and table['lisaGuide'][0] > 0x0000
+
+# The Disk Copy 4.2 header is 84 bytes long, and the data and tags follow it in that order.
+# Offsets 0x00-0x3F hold the image name, 0x40 the data size, 0x44 the tag size, 0x48 the data checksum, 0x4C the tag checksum,
+# 0x50 the disk format, 0x51 the format byte, and 0x52 the magic number 0x0100.
+dc42HeaderSize = 84
+dc42SectorSize = 512
+
+# Represents the layout of a Disk Copy 4.2 image, so that we can limit our searches to the data area and keep the checksums up to date when we change it.
+# The data and tags are exposed as views into the original contents (see viewOf), so nothing gets copied.
+class DiskCopyImage:
+    def __init__(self, contents, dataSize, tagSize, dataChecksum, tagChecksum):
+        self.dataStart = dc42HeaderSize
+        self.dataEnd = dc42HeaderSize + dataSize
+        self.tagStart = self.dataEnd
+        self.tagEnd = self.dataEnd + tagSize
+        self.dataChecksum = dataChecksum
+        self.tagChecksum = tagChecksum
+        self.data = viewOf(contents, self.dataStart, self.dataEnd)
+        self.tags = viewOf(contents, self.tagStart, self.tagEnd)
+        # The checksum state at the start of each data sector, filled in as far as we've needed it so far.
+        # The first sector always starts from 0. Keep the same DiskCopyImage around for as long as the contents are (see finishEdits) so that these get reused.
+        self.checkpoints = [0]
+
+    # Returns the checksum state at the start of the given data sector, computing and remembering any checkpoints that we don't have yet.
+    def stateBefore(self, sector):
+        known = len(self.checkpoints) - 1
+        if known < sector:
+            state = self.checkpoints[known]
+            for current, sectorData in self.sectors(known, sector):
+                state = sectorChecksum(sectorData, state)
+                self.checkpoints.append(state)
+        return self.checkpoints[sector]
+
+    # Goes through the data sectors from first up to (but not including) last, yielding each sector number along with its data.
+    # The data is fetched 128 sectors at a time, so that images that are being read from disk as they're needed don't need a separate read for every sector.
+    def sectors(self, first, last):
+        batch = 128
+        for batchStart in range(first, last, batch):
+            batchEnd = min(last, batchStart + batch)
+            batchData = memoryview(self.data[(batchStart * dc42SectorSize):(batchEnd * dc42SectorSize)])
+            if profile is not None:
+                profile.count('sliceCopies')
+            for sector in range(batchStart, batchEnd):
+                yield sector, batchData[((sector - batchStart) * dc42SectorSize):((sector - batchStart + 1) * dc42SectorSize)]
+
+    # Works out the header edits needed to keep the data and tag checksums correct after the given (offset, bytes) changes are made to the image.
+    # The Disk Copy checksum is a rotate-and-add chain, so a change to one sector affects the state of every sector after it, and everything from the first changed sector to the end has to be summed again.
+    # The sectors before it come from the checkpoints, which only saves time when the same DiskCopyImage gets several sets of changes (like it does when stamping).
+    # Only the sectors that the changes actually touch get copied and patched.
+    def checksumEdits(self, changes):
+        edits = []
+        # Sort the changes into the data sectors that they touch.
+        dirty = {}
+        tagChanges = []
+        for offset, data in changes:
+            if offset < self.dataEnd and offset + len(data) > self.dataStart:
+                for sector in range((max(offset, self.dataStart) - self.dataStart) // dc42SectorSize, (min(offset + len(data), self.dataEnd) - self.dataStart - 1) // dc42SectorSize + 1):
+                    dirty.setdefault(sector, []).append((offset, data))
+            if offset < self.tagEnd and offset + len(data) > self.tagStart:
+                tagChanges.append((offset, data))
+        if dirty:
+            first = min(dirty)
+            state = self.stateBefore(first)
+            for sector, sectorData in self.sectors(first, len(self.data) // dc42SectorSize):
+                if sector in dirty:
+                    sectorData = patchRange(sectorData, self.dataStart + sector * dc42SectorSize, dirty[sector])
+                state = sectorChecksum(sectorData, state)
+            if state != self.dataChecksum:
+                edits.append((0x48, state.to_bytes(4, byteorder='big')))
+        # We never edit the tags ourselves, but if anything does, they're small enough to just re-sum.
+        # The first 12 bytes of tag data (the first sector's tags) are left out of the tag checksum, as Disk Copy always has.
+        if tagChanges:
+            tags = patchRange(self.tags[0:len(self.tags)], self.tagStart, tagChanges)
+            state = dc42Checksum(tags[12:], 0)
+            if state != self.tagChecksum:
+                edits.append((0x4C, state.to_bytes(4, byteorder='big')))
+        return edits
+
+# Returns a copy of a region of the image, starting at file offset start, with any of the given (offset, bytes) changes that overlap it applied.
+def patchRange(region, start, changes):
+    patched = bytearray(region)
+    if profile is not None:
+        profile.count('sliceCopies')
+    for offset, data in changes:
+        low = max(offset, start)
+        high = min(offset + len(data), start + len(patched))
+        if low < high:
+            patched[(low - start):(high - start)] = data[(low - offset):(high - offset)]
+    return patched
+
+# Computes the Disk Copy 4.2 checksum of some data, continuing on from the given checksum state.
+# For every big-endian 16-bit word, the word is added to the checksum and then the checksum is rotated right by one bit.
+def dc42Checksum(data, state):
+    for word in struct.unpack('>' + str(len(data) // 2) + 'H', data):
+        state = (state + word) & 0xFFFFFFFF
+        state = (state >> 1) | ((state & 1) << 31)
+    return state
+
+# A data sector that's all zeros.
+zeroSector = bytes(dc42SectorSize)
+
+# Computes the Disk Copy 4.2 checksum of a data sector, continuing on from the given checksum state.
+# Adding a zero word just rotates the state by one bit, and a sector has 256 words, so an empty sector rotates it all the way around and leaves it the same. Those don't need summing at all.
+def sectorChecksum(sectorData, state):
+    if sectorData == zeroSector:
+        return state
+    return dc42Checksum(sectorData, state)
+
+# Checks whether the contents look like a Disk Copy 4.2 image, and if so, returns a DiskCopyImage describing it.
+# Otherwise, returns None, and the image gets treated as a raw dump.
+def parseDiskCopy(contents):
+    if len(contents) < dc42HeaderSize:
+        return None
+    header = contents[0:dc42HeaderSize]
+    dataSize, tagSize, dataChecksum, tagChecksum = struct.unpack_from('>IIII', header, 0x40)
+    # The name length has to fit in the name field, the magic number has to be there, and the sizes have to add up to the size of the file.
+    if header[0] > 63 or struct.unpack_from('>H', header, 0x52)[0] != 0x0100:
+        return None
+    if dataSize % dc42SectorSize != 0 or dc42HeaderSize + dataSize + tagSize != len(contents):
+        return None
+    return DiskCopyImage(contents, dataSize, tagSize, dataChecksum, tagChecksum)
+
+# File IDs from the block tags that identify the parts of the Lisa filesystem that we care about.
+# Every block on a Lisa disk has a tag, and bytes 4 and 5 of the tag hold the ID of the file that the block belongs to.
+mddfFileID = 0x0001
+catalogFileID = 0x0004
+
+# The name of an object file entry in the volume catalog, like '{T5}obj'. The number in the middle is the tool number.
+catalogEntryPattern = re.compile(b'\\{[Tt]([0-9]+)\\}(?:OBJ|obj)')
+
+# An object file entry in the volume catalog. The serial number is 65 bytes ahead of the start of its name and the bozo bits are 71 bytes ahead.
+class CatalogEntry:
+    def __init__(self, offset, toolNumber):
+        self.offset = offset
+        self.toolNumber = toolNumber
+
+# Represents the filesystem on a Lisa disk: the MDDF (medium descriptor data file) and the blocks that make up the volume catalog.
+# Everything that we look up gets restricted to these blocks, rather than searching windows of the image that they usually happen to fall in.
+class LisaVolume:
+    def __init__(self, contents, mddfOffset, catalogRanges):
+        self.mddfOffset = mddfOffset
+        # The MDDF starts with the filesystem version, and the volume name is a Pascal string (a length byte followed by up to 32 characters) at offset 12.
+        mddf = contents[mddfOffset:(mddfOffset + dc42SectorSize)]
+        self.fsVersion = struct.unpack_from('>H', mddf, 0)[0]
+        nameLength = min(mddf[12], 32)
+        self.volumeName = str(mddf[13:(13 + nameLength)], 'ascii', errors='ignore')
+        # The file offset ranges of the MDDF and of each contiguous run of catalog blocks.
+        self.ranges = [(mddfOffset, mddfOffset + dc42SectorSize)] + catalogRanges
+        # Build an index of all the object file entries in the catalog, in the order that they appear on disk.
+        self.objectEntries = []
+        for start, end in catalogRanges:
+            if profile is not None:
+                profile.count('searches')
+                profile.count('bytesScanned', end - start)
+            for match in catalogEntryPattern.finditer(contents[start:end]):
+                self.objectEntries.append(CatalogEntry(start + match.start(), str(match.group(1), 'ascii')))
+
+    # Returns the first offset in a sorted list that falls inside the MDDF or the catalog, or -1 if there isn't one.
+    def firstWithin(self, offsets):
+        for offset in offsets:
+            for start, end in self.ranges:
+                if offset >= start and offset < end:
+                    return offset
+        return -1
+
+# Parses the Lisa filesystem on a disk image, using the block tags to find the MDDF and the volume catalog.
+# Only Disk Copy 4.2 images carry tags, so raw images (and anything whose tags don't describe a Lisa filesystem) get None back, which means that we fall back to our usual heuristics.
+def parseLisaVolume(contents, disk):
+    if disk is None:
+        return None
+    sectors = len(disk.data) // dc42SectorSize
+    if sectors == 0 or len(disk.tags) % sectors != 0:
+        return None
+    # Sony floppies have 12-byte tags, while Twiggy and ProFile blocks have 20-byte ones. Either way, the file ID is in the same place.
+    tagSize = len(disk.tags) // sectors
+    if tagSize not in (12, 20):
+        return None
+    mddfOffset = -1
+    catalogRanges = []
+    # Go through the tags a batch at a time, in case they're being read from disk as they're needed.
+    tags = b''
+    for sector in range(sectors):
+        if sector % 4096 == 0:
+            tags = disk.tags[(sector * tagSize):((sector + 4096) * tagSize)]
+        tag = (sector % 4096) * tagSize
+        fileID = (tags[tag + 4] << 8) | tags[tag + 5]
+        offset = disk.dataStart + sector * dc42SectorSize
+        if fileID == mddfFileID and mddfOffset == -1:
+            mddfOffset = offset
+        elif fileID == catalogFileID:
+            # Merge catalog blocks that follow one another into a single range, so that entries that cross a block boundary still get found.
+            if catalogRanges and catalogRanges[-1][1] == offset:
+                catalogRanges[-1] = (catalogRanges[-1][0], offset + dc42SectorSize)
+            else:
+                catalogRanges.append((offset, offset + dc42SectorSize))
+    # We need both an MDDF and a catalog before we can say that we understand the filesystem.
+    if mddfOffset == -1 or not catalogRanges:
+        return None
+    return LisaVolume(contents, mddfOffset, catalogRanges)
+
+# Checks whether a file is one of the disk images that we act on, meaning that it has the extension .dc42 or .image.
+def isDiskImage(fname):
+    return fname.split('.')[len(fname.split('.')) - 1] == 'dc42' or fname.split(".")[len(fname.split('.')) - 1] == 'image'
+
+# Trims a list of (offset, bytes) edits down to just the byte ranges that actually differ from the current contents of the image.
+# For example, re-patching a routine with a new serial number only changes the 3 SN bytes, even though the edit covers the whole routine.
+def minimizeEdits(contents, edits):
+    changes = []
+    for offset, data in edits:
+        current = contents[offset:(offset + len(data))]
+        if profile is not None:
+            profile.count('sliceCopies')
+        start = -1
+        for position in range(len(data)):
+            if data[position] != current[position]:
+                # This byte differs, so start a new range if we aren't already in one.
+                if start == -1:
+                    start = position
+            elif start != -1:
+                # This byte is the same, so whatever range we were in ends here.
+                changes.append((offset + start, data[start:position]))
+                start = -1
+        if start != -1:
+            changes.append((offset + start, data[start:]))
+    return changes
+
+# Saves a list of changes back to the file once we're done, without rewriting the whole thing.
+# The changes should already be trimmed down by minimizeEdits, so only the byte ranges that actually changed are written.
+# We use positioned writes on the existing file, so the rest of the image is never touched.
+# Returns the number of bytes that were actually written.
+def saveEdits(filename, changes):
+    if not changes:
+        return 0
+    with open(filename, 'r+b') as image:
+        if profile is not None:
+            profile.count('filesOpened')
+        return writeChanges(image, changes)
+
+# Writes a list of changes to a file that's already open for writing. Returns the number of bytes that were written.
+def writeChanges(image, changes):
+    written = 0
+    for offset, data in changes:
+        # os.pwrite isn't available on Windows, so fall back to seeking there.
+        if hasattr(os, 'pwrite'):
+            written += os.pwrite(image.fileno(), data, offset)
+        else:
+            image.seek(offset)
+            written += image.write(data)
+    if profile is not None:
+        profile.count('writes', len(changes))
+        profile.count('bytesWritten', written)
+    return written
+
+# Reads back the bytes that a list of changes just wrote to an image, and checks that they hold what was meant to be written.
+# Only the changed ranges are read (with positioned reads), so this costs the same no matter how big the image is. The changes to Disk Copy 4.2 images include their new checksums, so those get checked too.
+# Returns the offset and length of every byte range that doesn't match.
+def verifyEdits(filename, changes):
+    mismatches = []
+    with open(filename, 'rb') as image:
+        if profile is not None:
+            profile.count('filesOpened')
+        for offset, data in changes:
+            actual = readAt(image, offset, len(data))
+            if actual == data:
+                continue
+            # Work out exactly which bytes are wrong, so that the user knows where to look. A short read means everything after it is missing.
+            start = None
+            for position in range(len(data)):
+                wrong = position >= len(actual) or actual[position] != data[position]
+                if wrong and start is None:
+                    start = position
+                elif not wrong and start is not None:
+                    mismatches.append((offset + start, position - start))
+                    start = None
+            if start is not None:
+                mismatches.append((offset + start, len(data) - start))
+    return mismatches
+
+# Verifies the changes that were just written to an image if the user asked for it, and adds a message saying how it went.
+# target is the file that the changes were actually written to, if that isn't the image itself (with -journal, it's the image's staging file).
+# Returns the list of mismatches from verifyEdits, or None if nothing was verified.
+def verifyImage(fname, changes, options, messages, target=None):
+    if not getattr(options, 'verify', False) or not changes:
+        return None
+    mismatches = verifyEdits(target or fname, changes)
+    checked = sum([len(data) for offset, data in changes])
+    if mismatches:
+        wrong = sum([length for offset, length in mismatches])
+        places = ', '.join([hex(offset) + ' (' + str(length) + ' byte(s))' for offset, length in mismatches[:5]]) + (', ...' if len(mismatches) > 5 else '')
+        messages.append(Color.BLUE + fname + ': ' + Color.RED + 'ERROR - Verification failed: ' + str(wrong) + ' of the ' + str(checked) + ' changed byte(s) read back wrong, at ' + places + '.' + Color.END)
+    else:
+        messages.append(Color.BLUE + fname + ': ' + Color.GREEN + 'Verified all ' + str(checked) + ' changed byte(s).' + Color.END)
+    return mismatches
+
+# Everything that we know about an image after analyzing it: what kind of disk it is, where its SN routines are, and its serialization and bozo bit info.
+# The plans for every operation (and the status messages) are worked out from just this, so it's also what the analysis cache saves for each image.
+class ImageReport:
+    def __init__(self):
+        # 'dc42' for Disk Copy 4.2 images and 'raw' for everything else.
+        self.diskKind = 'raw'
+        # The volume name from the MDDF, if we were able to parse the Lisa filesystem.
+        self.volumeName = None
+        # The offsets of every original SN routine.
+        self.originalRoutines = []
+        # The offset of every patched SN routine, the serial number it's patched with, and whether the rest of the patch after the serial number is intact.
+        self.patchedRoutines = []
+        # The name of the signature that each routine (original or patched) matched, by offset.
+        self.routineNames = {}
+        # The tool entry, if this is a tool disk.
+        self.isTool = False
+        self.isLisaWrite2 = False
+        self.toolOffset = -1
+        self.toolNumber = ''
+        self.toolSerial = 0
+        self.bozo = False
+        # Every tool's entry, for hard disks with lots of tools on them. See findToolEntries.
+        self.toolEntries = []
+        # The serialization info for LOS install disks.
+        self.isOfficeSystem = False
+        self.isOtherOffice = False
+        self.officeOffset = -1
+        self.officeSerial = 0
+        self.isLisaGuide = False
+
+    # Converts the report to a dictionary of plain values so that it can be saved.
+    def toDict(self):
+        return dict(self.__dict__)
+
+    # Rebuilds a report from a dictionary that was made by toDict.
+    @staticmethod
+    def fromDict(values):
+        report = ImageReport()
+        report.__dict__.update(values)
+        report.patchedRoutines = [tuple(routine) for routine in report.patchedRoutines]
+        report.toolEntries = [tuple(entry) for entry in report.toolEntries]
+        # JSON turns the offsets into strings, so turn them back into numbers.
+        report.routineNames = {int(offset): name for offset, name in report.routineNames.items()}
+        return report
+
+# Analyzes the contents of an image: scans it once for all of our signatures, and then looks up everything that we need to know in the match table.
+# The contents can be anything that supports the buffer protocol (bytes, bytearray, memoryview, mmap, and so on), or an ImageReader for images that are too big to read all at once.
+# Either way, they're never changed. If the contents have already been parsed with parseDiskCopy, pass the result in as disk to skip doing it again.
+def analyze(contents, disk=None):
+    report = ImageReport()
+    # If it's a Disk Copy 4.2 image, only scan the data area; the header and tags can't contain anything we're looking for.
+    if disk is None:
+        disk = parseDiskCopy(contents)
+    # Images that are being read from disk as they're needed get scanned a chunk at a time.
+    chunkSize = None
+    if isinstance(contents, ImageReader):
+        chunkSize = contents.chunkSize
+    if disk is not None:
+        report.diskKind = 'dc42'
+        table = scanImage(contents, disk.dataStart, disk.dataEnd, chunkSize)
+    else:
+        table = scanImage(contents, 0, None, chunkSize)
+    # Parse the Lisa filesystem if we can, so that we can go straight to the catalog entries instead of guessing where they are.
+    volume = parseLisaVolume(contents, disk)
+    if volume is not None:
+        report.volumeName = volume.volumeName
+    # Record every SN routine, and for the patched ones, the 3-byte serial number that sits right after the pre-SN part of the patch.
+    # The rest of each patched routine after the serial number should match its signature too; if it doesn't, the patch isn't complete.
+    report.originalRoutines = table['originalRoutine']
+    report.routineNames = table['routineNames']
+    for index in table['patchedRoutine']:
+        signature = routineSignatures[report.routineNames[index]]
+        routine = contents[index:(index + signature.length)]
+        oldSerial = routine[signature.serialOffset:(signature.serialOffset + 3)]
+        report.patchedRoutines.append((index, int.from_bytes(oldSerial, 'big'), signature.matchesPatched(routine)))
+    # Index every tool's entry too, in case this is a hard disk.
+    report.toolEntries = findToolEntries(contents, table, volume)
+    # Look up the tool entry that holds the serialization info.
+    report.isTool, index = findToolEntry(table, volume)
+    if report.isTool:
+        report.toolOffset = index
+        # Extract the 4-byte serial number that's located 65 bytes ahead of the tool string.
+        report.toolSerial = int.from_bytes(contents[(index + 65):(index + 69)], 'big')
+        # Now grab the tool number. It's the number that starts right after "T" and ends right before "}".
+        # Just grab the 20 bytes after the "T" and then cut it off at the "}" using the partition function and save that as a string.
+        report.toolNumber = str((contents[(index + 2):(index + 22)]), 'ascii', errors='ignore').partition("}")[0]
+        # The bozo bits are 71 bytes ahead of the tool string. A zero in the first or both bytes means it's off and ones in both means it's on.
+        report.bozo = contents[(index + 71):(index + 73)] == b'\x01\x01'
+        # A special case of a tool disk that doesn't have valid serialization info is the LisaWrite 2 disk.
+        report.isLisaWrite2 = isLisaWrite2(table, index)
+    else:
+        # If it's not a tool disk, then it might be an OS installer. The Office System 1 disk is the only one of the installers that records the serial number.
+        report.isOfficeSystem, report.isOtherOffice, index = findOfficeSystem(table, volume)
+        if report.isOfficeSystem:
+            report.officeOffset = index
+            # Grab the 4-byte serial number, which is 191 bytes ahead of the start of the string.
+            report.officeSerial = int.from_bytes(contents[(index + 191):(index + 195)], 'big')
+        # If it's not a tool or OS disk, then it's either LisaGuide or a bad disk.
+        report.isLisaGuide = isLisaGuide(table)
+    return report
+
+# Works out what needs to be done to patch an image with our fixed serial number.
+# Returns a list of (offset, bytes) edits, which is empty if nothing needs to be saved, along with the message to show the user.
+def planPatch(fname, report, options):
+    serial = options.patch
+    edits = []
+    # Replace every instance of the original SN routine with the patched routine from its signature, with the 24-bit SN from the user in the middle.
+    # The patched routine is exactly the same length as the original one, so none of the other offsets move around.
+    for index in report.originalRoutines:
+        edits += routineSignature(report, index).patchEdits(index, serial)
+    # If we found some instances of the original routine, tell the user how many were patched and the SN that they were patched with.
+    if edits:
+        return edits, Color.BLUE + fname + ': ' + Color.GREEN + 'Successfully patched ' + str(len(report.originalRoutines)) + ' instance(s) of original SN routine with serial number ' + str(serial) + '.' + Color.END
+    # If we found no instances of the original SN routine, this could either mean that it's not an LOS disk, or that it's already been patched.
+    # So check to see if there's a patched routine that's been patched with the exact SN that we're trying to patch with now.
+    for index, oldSerial, complete in report.patchedRoutines:
+        if complete and oldSerial == serial:
+            return [], Color.BLUE + fname + ': ' + Color.GREEN + 'Already patched with serial number ' + str(serial) + '!' + Color.END
+    # If that still isn't the case, then there are two options left: Either it's not an LOS disk, or it's already been patched, but with a different SN.
+    # So go through each instance of the patched SN routine, just as we did with the original SN routine earlier.
+    for index, oldSerial, complete in report.patchedRoutines:
+        # Overwrite the old patch with our new patch. Really, we could just overwrite the SN part, but this is easier, and only the bytes that change get written anyway.
+        edits += routineSignature(report, index).patchEdits(index, serial)
+    # If we didn't find any occurrances of the patched routine either, then this definitely isn't an LOS disk.
+    if not edits:
+        return [], Color.BLUE + fname + ': ' + Color.RED + 'ERROR - No instances of a SN routine found. Are you sure this is an LOS disk?' + Color.END
+    # Otherwise, tell the user how many instances of the routine were updated, what the old serial number was, and what the updated serial number is.
+    return edits, Color.BLUE + fname + ': ' + Color.GREEN + 'Updated ' + str(len(report.patchedRoutines)) + ' instance(s) of pre-existing patch from serial number ' + str(oldSerial) + ' to serial number ' + str(serial) + '.' + Color.END
+
+# Works out what needs to be done to revert a previously-patched image back to the original SN routine.
+# Returns a list of (offset, bytes) edits, which is empty if nothing needs to be saved, along with the message to show the user.
+def planUnpatch(fname, report):
+    edits = []
+    # Replace every instance of the patched SN routine with the original routine from its signature.
+    for index, oldSerial, complete in report.patchedRoutines:
+        edits += routineSignature(report, index).unpatchEdits(index)
+    # If we found some, tell the user how many instances of the routine were unpatched and the SN of patched routine that was previously there.
+    if edits:
+        return edits, Color.BLUE + fname + ': ' + Color.GREEN + 'Successfully reverted ' + str(len(report.patchedRoutines)) + ' instance(s) of patched SN routine, which used serial number ' + str(oldSerial) + ', to the original routine.' + Color.END
+    # If there's already an unpatched routine on the disk, then it's already an original disk.
+    if report.originalRoutines:
+        return [], Color.BLUE + fname + ': ' + Color.GREEN + 'Image is already unpatched!' + Color.END
+    # If we still don't find a routine, then it can't be an LOS disk. So tell the user.
+    return [], Color.BLUE + fname + ': ' + Color.RED + 'ERROR - No instances of a SN routine found. Are you sure this is an LOS disk?' + Color.END
+
+# Looks up the signature of the routine at index in an image.
+def routineSignature(report, index):
+    return routineSignatures[report.routineNames.get(index, defaultRoutineName)]
+
+# Works out what needs to be done to deserialize, bozoize, or debozoize an image.
+# Returns a list of (offset, bytes) edits, which is empty if nothing needs to be saved, along with the message to show the user.
+def planSerialization(fname, report, options):
+    removeSerial = options.deserialize
+    removeBozo = options.clearbozo
+    addBozo = options.setbozo
+    edits = []
+    save = False
+    message = Color.BLUE + fname + ': ' + Color.END
+    # If it is in fact a tool disk, work out any changes to make and the appropriate messages to print out to the user.
+    if report.isTool:
+        index = report.toolOffset
+        toolNumber = report.toolNumber
+        # If the user wants to deserialize, replace the serial with all 0's.
+        if removeSerial:
+            edits.append((index + 65, bytes('\x00\x00\x00\x00', 'ascii')))
+        # If the user wants to clear the bozo bits, set them to 0.
+        if removeBozo:
+            edits.append((index + 71, bytes('\x00', 'ascii')))
+        # And if they want to set them, then set them to 1.
+        if addBozo:
+            edits.append((index + 71, bytes('\x01\x01', 'ascii')))
+        # If this is the LisaWrite 2 disk, just tell the user and don't try to save any serialization changes to disk.
+        if report.isLisaWrite2:
+            message += Color.GREEN + 'There are no serialization features on the LisaWrite 2 (tool #' + toolNumber + ') disk, so nothing to do here.' + Color.END
+        else:
+            if report.toolSerial == 0 and removeSerial:
+                message += Color.GREEN + 'Tool #' + toolNumber + ' already deserialized! ' + Color.END
+            elif report.toolSerial > 0 and removeSerial:
+                save = True
+                message += Color.GREEN + 'Tool #' + toolNumber + ' deserialized; previously serialized with SN ' + str(report.toolSerial) + '. ' + Color.END
+            if addBozo and report.bozo == True:
+                message += Color.GREEN + 'Tool #' + toolNumber + "'s bozo bits already set, so nothing to do here!" + Color.END
+            elif addBozo:
+                save = True
+                message += Color.GREEN + 'Tool #' + toolNumber + "'s bozo bits set!" + Color.END
+            if removeBozo and report.bozo == False:
+                message += Color.GREEN + 'Tool #' + toolNumber + "'s bozo bits already cleared, so nothing to do here!" + Color.END
+            elif removeBozo:
+                save = True
+                message += Color.GREEN + 'Tool #' + toolNumber + "'s bozo bits cleared!" + Color.END
+        # Only hand back the edits if at least one of them actually changes something.
+        if not save:
+            edits = []
+        return edits, message
+    # If it's the Office System 1 disk, work out any changes that the user requested and the appropriate messages.
+    # The installers have no bozo bits; only a serial number.
+    if report.isOfficeSystem:
+        if report.officeSerial == 0 and removeSerial:
+            message += Color.GREEN + 'LOS installer already deserialized! ' + Color.END
+        elif report.officeSerial > 0 and removeSerial:
+            # If the user wants to deserialize, then replace this number with all 0's.
+            edits.append((report.officeOffset + 191, bytes('\x00\x00\x00\x00', 'ascii')))
+            message += Color.GREEN + 'LOS install disk 1 deserialized; previously serialized with SN ' + str(report.officeSerial) + '. ' + Color.END
+        if addBozo:
+            message += Color.GREEN + 'No bozo bits to set on LOS install disks.' + Color.END
+        elif removeBozo:
+            message += Color.GREEN + 'No bozo bits to clear on LOS install disks.'+ Color.END
+    # If it's one of the other installer disks, just print a message saying that there's nothing to do here.
+    elif report.isOtherOffice:
+        if removeSerial and not removeBozo and not addBozo:
+            message += Color.GREEN + 'Nothing to deserialize on LOS install disks 2 and onward.' + Color.END
+        if removeSerial and removeBozo:
+            message += Color.GREEN + 'Nothing to deserialize or debozoize on LOS install disks 2 and onward.' + Color.END
+        if removeSerial and addBozo:
+            message += Color.GREEN + 'Nothing to deserialize or bozoize on LOS install disks 2 and onward.' + Color.END
+        if not removeSerial and addBozo:
+            message += Color.GREEN + 'No bozo bits to set on LOS install disks.' + Color.END
+        if not removeSerial and removeBozo:
+            message += Color.GREEN + 'No bozo bits to clear on LOS install disks.' + Color.END
+    # If it's not a tool or OS disk, then it's either LisaGuide or a bad disk.
+    # If it's LisaGuide, there's nothing to do and we're good.
+    elif report.isLisaGuide:
+        message = Color.BLUE + fname + ': ' + Color.GREEN + 'Nothing to ' + Color.END
+        if removeSerial and not removeBozo and not addBozo:
+            message += Color.GREEN + 'deserialize '
+        if removeSerial and removeBozo:
+            message += Color.GREEN + 'deserialize or debozoize '
+        if removeSerial and addBozo:
+            message += Color.GREEN + 'deserialize or bozoize '
+        if not removeSerial and removeBozo:
+            message += Color.GREEN + 'debozoize '
+        if not removeSerial and addBozo:
+            message += Color.GREEN + 'bozize '
+        message += Color.GREEN + 'on the LisaGuide disk.' + Color.END
+    # If we don't find that text, then this probably isn't a Lisa install/tool disk.
+    else:
+        message = Color.BLUE + fname + ': ' + Color.RED + 'ERROR - Unable to find anything to ' + Color.END
+        if removeSerial and not removeBozo and not addBozo:
+            message += Color.RED + 'deserialize.'
+        if removeSerial and removeBozo:
+            message += Color.RED + 'deserialize or debozoize.'
+        if removeSerial and addBozo:
+            message += Color.RED + 'deserialize or bozoize.'
+        if not removeSerial and removeBozo:
+            message += Color.RED + 'debozoize.'
+        if not removeSerial and addBozo:
+            message += Color.RED + 'bozize.'
+        message += ' Are you sure this is an LOS intaller or tool disk?' + Color.END
+    return edits, message
+
+# Works out what needs to be done to deserialize, bozoize, or debozoize every tool on a hard disk, all in one go.
+# Returns a list of (offset, bytes) edits, which is empty if nothing needs to be saved, along with a list of messages to show the user: one for each tool.
+def planHardDiskSerialization(fname, report, options):
+    if not report.toolEntries:
+        return [], [Color.BLUE + fname + ': ' + Color.RED + 'ERROR - Unable to find any installed tools. Are you sure this is an LOS hard disk?' + Color.END]
+    edits = []
+    messages = []
+    for index, toolNumber, serial, bozo, lisaWrite2 in report.toolEntries:
+        message = Color.BLUE + fname + ': ' + Color.END
+        if lisaWrite2:
+            messages.append(message + Color.GREEN + 'There are no serialization features on LisaWrite 2 (tool #' + toolNumber + '), so nothing to do here.' + Color.END)
+            continue
+        # These are the same edits that planSerialization makes for a tool disk, but only the ones that change something get kept.
+        if options.deserialize and serial == 0:
+            message += Color.GREEN + 'Tool #' + toolNumber + ' already deserialized! ' + Color.END
+        elif options.deserialize:
+            edits.append((index + 65, bytes('\x00\x00\x00\x00', 'ascii')))
+            message += Color.GREEN + 'Tool #' + toolNumber + ' deserialized; previously serialized with SN ' + str(serial) + '. ' + Color.END
+        if options.setbozo and bozo:
+            message += Color.GREEN + 'Tool #' + toolNumber + "'s bozo bits already set, so nothing to do here!" + Color.END
+        elif options.setbozo:
+            edits.append((index + 71, bytes('\x01\x01', 'ascii')))
+            message += Color.GREEN + 'Tool #' + toolNumber + "'s bozo bits set!" + Color.END
+        if options.clearbozo and not bozo:
+            message += Color.GREEN + 'Tool #' + toolNumber + "'s bozo bits already cleared, so nothing to do here!" + Color.END
+        elif options.clearbozo:
+            edits.append((index + 71, bytes('\x00', 'ascii')))
+            message += Color.GREEN + 'Tool #' + toolNumber + "'s bozo bits cleared!" + Color.END
+        messages.append(message)
+    return edits, messages
+
+# Describes whether an image's SN routines are patched, which is how every status message starts.
+def describeRoutines(fname, report):
+    # If we found an instance of the original (unpatched) serial number routine, tell the user that this disk is not patched.
+    if report.originalRoutines:
+        message = Color.BLUE + fname + ': ' + Color.YELLOW + 'Image is not patched. ' + Color.END
+    # If we found the patch instead, tell the user it's patched as well as the serial number that we're patched with.
+    elif report.patchedRoutines:
+        message = Color.BLUE + fname + ': ' + Color.GREEN + 'Patched with SN ' + str(report.patchedRoutines[0][1]) + '. ' + Color.END
+    # If not, then it's not an LOS disk, so tell the user.
+    else:
+        message = Color.BLUE + fname + ': ' + Color.RED + 'No instances of a SN routine found. Are you sure this is an LOS disk? ' + Color.END
+    return message
+
+# Describes the state of every tool on a hard disk without changing anything: a message for the disk as a whole, and then one for each tool.
+def describeHardDisk(fname, report):
+    message = describeRoutines(fname, report)
+    if not report.toolEntries:
+        return [message + Color.RED + 'Unable to find any installed tools. Are you sure this is an LOS hard disk?' + Color.END]
+    messages = [message + Color.GREEN + 'Found ' + str(len(report.toolEntries)) + ' installed tool(s).' + Color.END]
+    for offset, toolNumber, serial, bozo, lisaWrite2 in report.toolEntries:
+        message = Color.BLUE + fname + ': ' + Color.END
+        if lisaWrite2:
+            message += Color.GREEN + 'No serialization or bozo bits on LisaWrite 2 (tool #' + toolNumber + ').' + Color.END
+        else:
+            if serial == 0:
+                message += Color.GREEN + 'Tool #' + toolNumber + ' deserialized' + Color.END
+            else:
+                message += Color.YELLOW + 'Tool #' + toolNumber + ' serialized with SN ' + str(serial) + Color.END
+            if bozo:
+                message += Color.YELLOW + ' and bozo bits are set.' + Color.END
+            else:
+                message += Color.GREEN + ' and bozo bits are cleared.' + Color.END
+        messages.append(message)
+    return messages
+
+# Describes the existing serialization attributes of an image without changing anything.
+def describeStatus(fname, report):
+    message = describeRoutines(fname, report)
+    # If it's a tool, tell the user its serialization and bozoization status.
+    if report.isTool:
+        toolNumber = report.toolNumber
+        # Account for the special case for the LisaWrite 2 disk.
+        if report.isLisaWrite2:
+            message += Color.GREEN + 'No serialization or bozo bits on the LisaWrite 2 (tool #' + toolNumber + ') disk.' + Color.END
+        else:
+            if report.toolSerial == 0:
+                message += Color.GREEN + 'Tool #' + toolNumber + ' deserialized' + Color.END
+            elif report.toolSerial > 0:
+                message += Color.YELLOW + 'Tool #' + toolNumber + ' serialized with SN ' + str(report.toolSerial) + Color.END
+            if report.bozo == True:
+                message += Color.YELLOW + ' and bozo bits are set.' + Color.END
+            elif report.bozo == False:
+                message += Color.GREEN + ' and bozo bits are cleared.' + Color.END
+    # If it's install disk 1, then give the user the appropriate serialization info.
+    elif report.isOfficeSystem:
+        if report.officeSerial == 0:
+            message += Color.GREEN + 'LOS install is deserialized. ' + Color.END
+        elif report.officeSerial > 0:
+            message += Color.YELLOW + 'Serialized with SN ' + str(report.officeSerial) + '. ' + Color.END
+        message += Color.GREEN + 'No bozo bits on LOS install disk 1.' + Color.END
+    # If it's one of the other install disks, tell the user that there's no info to give.
+    elif report.isOtherOffice:
+        message += Color.GREEN + 'No serialization or bozo bits on LOS install disks 2 and onward.' + Color.END
+    # If it's not an OS installer or a tool, it's either LisaGuide or something else random.
+    # If it's LisaGuide, there's no serialization or bozo bits to worry about.
+    elif report.isLisaGuide:
+        message += Color.GREEN + 'No serialization or bozo bits on the LisaGuide disk.' + Color.END
+    # If not, then this isn't an LOS tool/installer, so tell the user.
+    else:
+        message += Color.RED + 'Unable to find any serialization or bozo bit info. Are you sure this is an LOS installer or tool disk?' + Color.END
+    return message
+
+# The operations to perform on an image. The command line options get turned into one of these, and programs that use this file as a library can make their own.
+# patch is the serial number to patch the SN routine with, or None to leave it alone.
+# If harddisk is set, the image is treated as a hard disk, and every tool on it gets deserialized, bozoized, or debozoized (or described) instead of just one.
+class Plan:
+    def __init__(self, patch=None, unpatch=False, deserialize=False, setbozo=False, clearbozo=False, harddisk=False):
+        if patch is not None and unpatch:
+            raise ValueError("patch and unpatch can't be used together!")
+        if setbozo and clearbozo:
+            raise ValueError("setbozo and clearbozo can't be used together!")
+        if patch is not None and (patch < 0 or patch > 16777215):
+            raise ValueError('serialNumber ' + str(patch) + ' is out of bounds! Allowed range is 0 - 16,777,215.')
+        self.patch = patch
+        self.unpatch = unpatch
+        self.deserialize = deserialize
+        self.setbozo = setbozo
+        self.clearbozo = clearbozo
+        self.harddisk = harddisk
+
+# Works out every edit that the plan calls for, along with the messages to show the user about the image named fname.
+# If the plan doesn't change anything, the messages describe the image's status instead.
+def planEdits(fname, report, plan):
+    edits = []
+    messages = []
+    # Gather up the edits and messages for each of the operations in the plan.
+    if plan.patch is not None:
+        patchEdits, message = planPatch(fname, report, plan)
+        edits += patchEdits
+        messages.append(message)
+    elif plan.unpatch:
+        patchEdits, message = planUnpatch(fname, report)
+        edits += patchEdits
+        messages.append(message)
+    if (plan.deserialize or plan.clearbozo or plan.setbozo) and plan.harddisk:
+        serialEdits, toolMessages = planHardDiskSerialization(fname, report, plan)
+        edits += serialEdits
+        messages += toolMessages
+    elif plan.deserialize or plan.clearbozo or plan.setbozo:
+        serialEdits, message = planSerialization(fname, report, plan)
+        edits += serialEdits
+        messages.append(message)
+    # If there's nothing to do, then we just want to provide info about the image without changing anything.
+    if not isModifying(plan) and plan.harddisk:
+        messages += describeHardDisk(fname, report)
+    elif not isModifying(plan):
+        messages.append(describeStatus(fname, report))
+    return edits, messages
+
+# Turns planned edits into the final list of changes to make to an image: just the bytes that actually differ, plus the header changes that keep Disk Copy 4.2 checksums correct.
+# Pass in the image's DiskCopyImage if you already have one (from parseDiskCopy) so that the checksum state it's already worked out gets reused; otherwise, the contents get parsed again.
+def finishEdits(contents, edits, disk=None):
+    changes = minimizeEdits(contents, edits)
+    if disk is None:
+        disk = parseDiskCopy(contents)
+    if changes and disk is not None:
+        changes += disk.checksumEdits(changes)
+    return changes
+
+# Works out the changes that a plan makes to the contents of an image, and returns them as a list of (offset, bytes) pairs.
+# If the contents are writable (a bytearray or a writable mmap, for instance), the changes are made to them as well; read-only contents are left alone.
+# Pass in the image's report if you already have one from analyze, to skip analyzing it again.
+# Nothing here touches any shared state, so any number of threads can use this at once, as long as they aren't working on the same buffer.
+def apply(buffer, plan, report=None):
+    disk = parseDiskCopy(buffer)
+    if report is None:
+        report = analyze(buffer, disk)
+    edits, messages = planEdits('', report, plan)
+    changes = finishEdits(buffer, edits, disk)
+    view = memoryview(buffer)
+    if not view.readonly:
+        for offset, data in changes:
+            view[offset:(offset + len(data))] = data
+    return changes
+
+# A patched copy of an image that's never actually made: the original contents, left untouched, plus the handful of byte ranges that a plan changes.
+# It reads just like a file (and can be wrapped in io.BufferedReader or handed to shutil.copyfileobj), and it can also be sliced like the contents themselves.
+# Anything that doesn't touch a patched range comes straight out of the original contents without being copied, so any number of variants of the same image
+# (with different serial numbers or bozo bit states, say) can share a single read-only mmap of it.
+class PatchedView(io.RawIOBase):
+    def __init__(self, base, changes):
+        super().__init__()
+        self.base = memoryview(base).cast('B')
+        self.size = len(self.base)
+        self.position = 0
+        # Anything else that the view should close along with itself, like the mmap and the file that openPatchedView opened.
+        self.resources = []
+        # The report for the image, if the view came from patchedView or openPatchedView.
+        self.report = None
+        # The patched ranges, in order, with overlapping and adjacent changes merged together. Later changes win, just like they would if they were written to a file.
+        self.starts = []
+        self.patches = []
+        ranges = []
+        for offset, data in sorted(changes, key=lambda change: change[0]):
+            if ranges and offset <= ranges[-1][1]:
+                ranges[-1] = (ranges[-1][0], max(ranges[-1][1], offset + len(data)))
+            else:
+                ranges.append((offset, offset + len(data)))
+        for start, end in ranges:
+            self.starts.append(start)
+            self.patches.append(bytes(patchRange(self.base[start:end], start, changes)))
+
+    def __len__(self):
+        return self.size
+
+    # Slices come back as a memoryview of the original contents if they don't touch any of the patched ranges, and as bytes otherwise.
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            low, high, step = key.indices(self.size)
+            if step != 1:
+                raise ValueError('PatchedView only supports contiguous slices')
+            pieces = list(self.pieces(low, high))
+            if len(pieces) == 1 and isinstance(pieces[0], memoryview):
+                return pieces[0]
+            return b''.join(pieces)
+        if key < 0:
+            key += self.size
+        if key < 0 or key >= self.size:
+            raise IndexError('PatchedView index out of range')
+        return self[key:(key + 1)][0]
+
+    # Yields the view's contents from start up to end as a series of pieces: memoryviews of the original contents in between the patched ranges, and the patched bytes themselves.
+    def pieces(self, start, end):
+        position = start
+        index = max(0, bisect.bisect_right(self.starts, start) - 1)
+        while position < end:
+            if index < len(self.starts) and self.starts[index] + len(self.patches[index]) <= position:
+                index += 1
+            elif index < len(self.starts) and self.starts[index] <= position:
+                patch = self.patches[index]
+                pieceEnd = min(end, self.starts[index] + len(patch))
+                yield patch[(position - self.starts[index]):(pieceEnd - self.starts[index])]
+                position = pieceEnd
+                index += 1
+            else:
+                pieceEnd = end if index == len(self.starts) else min(end, self.starts[index])
+                yield self.base[position:pieceEnd]
+                position = pieceEnd
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError('negative seek position ' + str(offset))
+        self.position = offset
+        return self.position
+
+    def readinto(self, buffer):
+        target = memoryview(buffer).cast('B')
+        copied = 0
+        for piece in self.pieces(self.position, min(self.size, self.position + len(target))):
+            target[copied:(copied + len(piece))] = piece
+            copied += len(piece)
+        self.position += copied
+        return copied
+
+    # Writes the whole patched image to a file, which can be a path (including a FIFO, in which case this waits until something opens the other end) or a file that's already open for writing.
+    # Paths that aren't FIFOs get written under a temporary name first and then moved into place, so that a failed export never leaves a half-written file behind (or truncates a file that's still being read).
+    # Returns the number of bytes written.
+    def export(self, destination):
+        if isinstance(destination, (str, bytes, os.PathLike)):
+            import stat
+            destination = os.fsdecode(destination)
+            if os.path.exists(destination) and stat.S_ISFIFO(os.stat(destination).st_mode):
+                with open(destination, 'wb') as output:
+                    return self.export(output)
+            temporary = destination + '.losserialtool-overlay'
+            try:
+                with open(temporary, 'wb') as output:
+                    written = self.export(output)
+                os.replace(temporary, destination)
+            except BaseException:
+                if os.path.lexists(temporary):
+                    os.remove(temporary)
+                raise
+            return written
+        written = 0
+        for piece in self.pieces(0, self.size):
+            destination.write(piece)
+            written += len(piece)
+        destination.flush()
+        return written
+
+    def close(self):
+        if not self.closed:
+            self.base.release()
+            for resource in reversed(self.resources):
+                # If some of the view's pieces are still around (say, in the traceback of an error), the mmap can't be closed yet, but it'll close itself once they're gone.
+                try:
+                    resource.close()
+                except BufferError:
+                    pass
+        super().close()
+
+# Works out the changes that a plan makes to the contents of an image, just like apply, but hands back a PatchedView of the changed image instead of making the changes.
+# The contents are never changed, so they can be read-only.
+def patchedView(buffer, plan, report=None):
+    disk = parseDiskCopy(buffer)
+    if report is None:
+        report = analyze(buffer, disk)
+    edits, messages = planEdits('', report, plan)
+    view = PatchedView(buffer, finishEdits(buffer, edits, disk) if edits else [])
+    view.report = report
+    return view
+
+# Opens an image file as a read-only mmap and returns a PatchedView of it with the plan's changes, along with the messages describing what the plan did.
+# The image file is never written to. Closing the view closes the mmap and the file too.
+def openPatchedView(fname, plan):
+    import mmap
+    image = open(fname, 'rb')
+    try:
+        base = mmap.mmap(image.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        image.close()
+        raise
+    try:
+        disk = parseDiskCopy(base)
+        report = analyze(base, disk)
+        edits, messages = planEdits(fname, report, plan)
+        view = PatchedView(base, finishEdits(base, edits, disk) if edits else [])
+    except Exception:
+        base.close()
+        image.close()
+        raise
+    view.resources = [image, base]
+    view.report = report
+    return view, messages
+
+# Deltas record the changes to an image along with the bytes that they replace, so that they can be applied to (or reverted from) a copy of the image later on instead of changing the image itself.
+# They're saved as JSON: the image's name and size, and a list of [offset, old bytes, new bytes] changes with the bytes written out in hex.
+deltaFormat = 'LOSSerialTool delta'
+deltaExtension = '.losdelta'
+
+# Builds a delta for the changes to an image with the given contents.
+def makeDelta(fname, contents, changes):
+    records = []
+    for offset, data in changes:
+        records.append([offset, bytes(contents[offset:(offset + len(data))]).hex(), bytes(data).hex()])
+    return {'format': deltaFormat, 'version': 1, 'image': fname, 'size': len(contents), 'changes': records}
+
+# Works out the changes that applying a delta (or reverting it, if revert is set) makes to the contents of an image, and returns them as a list of (offset, bytes) pairs.
+# Only the bytes that the delta touches get looked at, so this is fast even for contents that are being read from disk as they're needed.
+# Changes that have already been made are skipped, so applying a delta twice does no harm.
+# Raises ValueError if the delta doesn't belong to these contents: if the size is wrong, or if the bytes are neither the ones it expects to replace nor the ones it would put there.
+def planDelta(contents, delta, revert=False):
+    if delta.get('format') != deltaFormat:
+        raise ValueError('not a ' + deltaFormat)
+    if len(contents) != delta['size']:
+        raise ValueError('the image is ' + str(len(contents)) + ' bytes long, but the delta is for one that\'s ' + str(delta['size']) + ' bytes long')
+    changes = []
+    for offset, old, new in delta['changes']:
+        old = bytes.fromhex(old)
+        new = bytes.fromhex(new)
+        if revert:
+            old, new = new, old
+        current = contents[offset:(offset + len(new))]
+        if current == new:
+            continue
+        if current != old:
+            raise ValueError('the bytes at offset ' + hex(offset) + ' aren\'t the ones that the delta expects')
+        changes.append((offset, new))
+    return changes
+
+# Applies a delta to the contents of an image (or reverts it, if revert is set), and returns the changes as a list of (offset, bytes) pairs, just like apply.
+# If the contents are writable, the changes are made to them as well. Raises ValueError if the delta doesn't belong to these contents.
+def applyDelta(buffer, delta, revert=False):
+    changes = planDelta(buffer, delta, revert)
+    view = memoryview(buffer)
+    if not view.readonly:
+        for offset, data in changes:
+            view[offset:(offset + len(data))] = data
+    return changes
+
+# Works out where the delta for an image goes inside directory. The image's path is kept, so that images with the same name in different directories don't collide.
+def deltaPath(directory, fname):
+    path = os.path.relpath(os.path.abspath(fname))
+    if path.startswith(os.pardir):
+        path = os.path.splitdrive(os.path.abspath(fname))[1].lstrip(os.sep)
+    return os.path.join(directory, path + deltaExtension)
+
+# Saves a delta to a file, creating any directories that it needs.
+def saveDelta(path, delta):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as deltaFile:
+        json.dump(delta, deltaFile)
+
+# Applies (or reverts) a saved delta to the image that it was made for, and returns its result, just like processImage does.
+# The image is found using the path in the delta, relative to the current directory, so run this from the directory that the delta was made from (or a copy of it).
+# With -verify, the changed bytes get read back again afterwards, and what verifyImage found goes in the result too.
+def applyDeltaFile(path, revert, options):
+    verb = 'reverted' if revert else 'applied'
+    startTime = time.perf_counter()
+    timing = {}
+    report = None
+    try:
+        with open(path, 'r') as deltaFile:
+            delta = json.load(deltaFile)
+        fname = delta['image']
+        with open(fname, 'rb') as image:
+            changes = planDelta(ImageReader(image, options.chunksize), delta, revert)
+            timing['read'] = time.perf_counter() - startTime
+            # The JSON Lines record describes the image as it was before the delta changed it, just like it does for every other image.
+            if getattr(options, 'format', 'text') == 'jsonl':
+                scanTime = time.perf_counter()
+                report = analyze(ImageReader(image, options.chunksize))
+                timing['scan'] = time.perf_counter() - scanTime
+    except (OSError, ValueError, KeyError, TypeError) as error:
+        return deltaResult(path, options, Color.BLUE + path + ': ' + Color.RED + 'ERROR - Unable to use this delta: ' + str(error) + Color.END)
+    if not changes:
+        messages = [Color.BLUE + fname + ': ' + Color.GREEN + 'Delta ' + path + ' is already ' + verb + '.' + Color.END]
+        return finishResult(fname, 0, messages, None, makeDeltaRecord(fname, report, options, messages, 0, timing, path, revert), None)
+    writeTime = time.perf_counter()
+    written = saveEdits(fname, changes)
+    timing['write'] = time.perf_counter() - writeTime
+    messages = [Color.BLUE + fname + ': ' + Color.GREEN + 'Delta ' + path + ' ' + verb + '; ' + str(written) + ' byte(s) changed.' + Color.END]
+    mismatches = verifyImage(fname, changes, options, messages)
+    return finishResult(fname, written, messages, None, makeDeltaRecord(fname, report, options, messages, written, timing, path, revert), mismatches)
+
+# Builds the JSON Lines record for an image that a delta was applied to or reverted from: the usual record for the image, with the delta and what was done with it as its actions.
+# Returns None unless we're writing JSON Lines.
+def makeDeltaRecord(fname, report, options, messages, written, timing, path, revert):
+    record = makeRecord(fname, report, options, messages, written, timing)
+    if record is not None:
+        record['actions'] = ['revertdelta' if revert else 'applydelta']
+        record['delta'] = path
+    return record
+
+# Builds the result for a delta that couldn't be used at all, with a message saying why. If we're writing JSON Lines, it gets a record of its own too.
+def deltaResult(path, options, message):
+    record = None
+    if getattr(options, 'format', 'text') == 'jsonl':
+        record = {'delta': path, 'image': None, 'messages': [colorPattern.sub('', message)[(len(path) + 2):].strip()], 'bytesWritten': 0}
+    return path, 0, [message], None, record, None, None
+
+# With -journal, a batch's changes never get written straight to the images. Instead, each image that changes is copied to a staging file next to it, the changes are written to the copy, and the journal gets a note of them first.
+# The journal is a JSON Lines file of deltas (with the image's full path and its staging file added), so -rollback can undo the whole batch later on.
+# Every so often, at a commit point, everything that's been written so far is flushed to disk all at once, and then the staging files are renamed over their images.
+# A crash can only ever leave an image as it was or as it should be, never half changed, and the flush happens once per group of images instead of once per image.
+stagingExtension = '.losserialtool-journal'
+
+# Adds a line to the journal. Worker processes add to it too, so each line goes in with a single write to a file that's opened for appending, which keeps the lines from getting mixed up with each other.
+def appendJournal(path, entry):
+    journal = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(journal, bytes(json.dumps(entry) + '\n', 'utf-8'))
+    finally:
+        os.close(journal)
+
+# Gets ready to change an image with -journal: notes the changes in the journal, along with the bytes that they replace, and then copies the image to its staging file.
+# Returns the name of the staging file, which is where the changes should be written instead of to the image.
+def stageEdits(fname, changes, options):
+    staged = fname + stagingExtension
+    with open(fname, 'rb') as image:
+        entry = makeDelta(os.path.abspath(fname), ImageReader(image, options.chunksize), changes)
+    entry['staged'] = os.path.abspath(staged)
+    appendJournal(options.journal, entry)
+    # copy2 keeps the image's permissions, so the staging file can take its place without anything else noticing.
+    shutil.copy2(fname, staged)
+    return staged
+
+# Makes sure that everything that's been written to these files is actually on the disk, along with the directory entries that point to them.
+# Each file gets its own fsync, which only has to wait for that file. os.sync would cover every file at once, but it flushes every mounted filesystem (network shares included), and on macOS and the BSDs, it can return before the data is actually on the disk.
+def syncFiles(paths):
+    for path in paths:
+        handle = os.open(path, os.O_RDWR | getattr(os, 'O_BINARY', 0))
+        try:
+            flushHandle(handle)
+        finally:
+            os.close(handle)
+    syncDirectories(paths)
+
+# Makes sure that the directories holding these files are on the disk, so that files that were just created or renamed into them don't disappear after a crash.
+# Each directory only gets flushed once. Windows can't open a directory to flush it, and doesn't need to, so there's nothing to do there.
+def syncDirectories(paths):
+    if os.name == 'nt':
+        return
+    for directory in sorted(set([os.path.dirname(os.path.abspath(path)) for path in paths])):
+        handle = os.open(directory, os.O_RDONLY)
+        try:
+            flushHandle(handle)
+        finally:
+            os.close(handle)
+
+# Flushes an open file (or directory) to the disk. On macOS, fsync only gets the data as far as the drive's own cache, so F_FULLFSYNC gets used there instead.
+def flushHandle(handle):
+    import sys
+    if sys.platform == 'darwin':
+        import fcntl
+        fcntl.fcntl(handle, fcntl.F_FULLFSYNC)
+    else:
+        os.fsync(handle)
+
+# Keeps track of the images that have been staged since the last commit point, and commits them once there are enough of them.
+class WriteJournal:
+    def __init__(self, path, groupSize):
+        self.path = path
+        self.groupSize = groupSize
+        self.pending = []
+        self.committed = 0
+        self.commits = 0
+
+    # Notes that an image's changes have been staged, committing them (and the rest of the group) if the group is full.
+    def add(self, fname):
+        self.pending.append(fname)
+        if len(self.pending) >= self.groupSize:
+            self.commit()
+
+    # Flushes the journal and every staged image to disk, and then moves the staged images into place and flushes the renames too.
+    # The note that they were committed gets flushed along with the next group (or when the journal is closed).
+    def commit(self):
+        if not self.pending:
+            return
+        syncFiles([self.path] + [fname + stagingExtension for fname in self.pending])
+        for fname in self.pending:
+            os.replace(fname + stagingExtension, fname)
+        syncDirectories(self.pending)
+        appendJournal(self.path, {'committed': [os.path.abspath(fname) for fname in self.pending]})
+        self.committed += len(self.pending)
+        self.commits += 1
+        self.pending = []
+
+    # Commits whatever's left, and flushes the last of the renames to disk.
+    def close(self):
+        self.commit()
+        if self.commits > 0:
+            syncFiles([self.path])
+
+# Undoes every change in a journal, newest first, and returns a result for each image in it, just like processImage does.
+# Staging files that never got committed are deleted, and changes that were never made (or have already been undone) are skipped, so it's safe to roll back the same journal more than once.
+def rollbackJournal(path, options):
+    entries = []
+    with open(path, 'r') as journal:
+        for line in journal:
+            if line.strip():
+                entry = json.loads(line)
+                if 'changes' in entry:
+                    entries.append(entry)
+    results = []
+    changed = []
+    for entry in reversed(entries):
+        fname = entry['image']
+        if os.path.lexists(entry['staged']):
+            os.remove(entry['staged'])
+        try:
+            with open(fname, 'rb') as image:
+                changes = planDelta(ImageReader(image, options.chunksize), entry, True)
+        except (OSError, ValueError) as error:
+            results.append(rollbackResult(path, fname, options, Color.BLUE + fname + ': ' + Color.RED + 'ERROR - Unable to roll back the changes to this image: ' + str(error) + Color.END, error=str(error)))
+            continue
+        if not changes:
+            results.append(rollbackResult(path, fname, options, Color.BLUE + fname + ': ' + Color.GREEN + 'Nothing to roll back; these changes were never made or have already been undone.' + Color.END))
+            continue
+        written = saveEdits(fname, changes)
+        changed.append(fname)
+        results.append(rollbackResult(path, fname, options, Color.BLUE + fname + ': ' + Color.GREEN + 'Rolled back ' + str(sum([len(data) for offset, data in changes])) + ' changed byte(s).' + Color.END, written))
+    syncFiles(changed)
+    return results
+
+# Builds the result for an image that -rollback went through, with a message saying what happened to it. If we're writing JSON Lines, it gets a record of its own too.
+# If the journal itself couldn't be used, fname is None and the result is for the journal instead.
+def rollbackResult(path, fname, options, message, written=0, error=None):
+    name = path if fname is None else fname
+    record = None
+    if getattr(options, 'format', 'text') == 'jsonl':
+        record = {'image': fname, 'journal': path, 'rolledBack': written > 0, 'error': error, 'messages': [colorPattern.sub('', message)[(len(name) + 2):].strip()], 'bytesWritten': written}
+    return name, written, [message], None, record, None, None
+
+# A sidecar cache of analysis results, kept in a small SQLite database so that we don't have to re-read and re-scan images that haven't changed.
+# Each entry is keyed by the image's path, and we only trust it if the image's size and modification time still match.
+# We also keep a hash of each image's contents, so that an image that was copied or touched without being changed can reuse the analysis of the same contents.
+class AnalysisCache:
+    def __init__(self, path, maxEntries):
+        # sqlite3 only gets imported when the cache is actually used, so that importing this module stays cheap.
+        import sqlite3
+        self.path = path
+        self.maxEntries = maxEntries
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS images (path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, hash TEXT, report TEXT, used INTEGER)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS imagesByHash ON images (hash)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS imagesByUse ON images (used)')
+        # Everything that gets used or stored during this run is stamped with the same time, so that eviction can tell which entries are stale.
+        self.now = time.time_ns()
+
+    # Looks up the cached report for an image, but only if its size and modification time haven't changed since it was cached.
+    def lookup(self, fname):
+        stat = os.stat(fname)
+        row = self.connection.execute('SELECT size, mtime, report FROM images WHERE path = ?', (os.path.abspath(fname),)).fetchone()
+        if row is None or row[0] != stat.st_size or row[1] != stat.st_mtime_ns:
+            return None
+        self.connection.execute('UPDATE images SET used = ? WHERE path = ?', (self.now, os.path.abspath(fname)))
+        return loadCachedReport(row[2])
+
+    # Saves the report for an image along with the size, modification time, and content hash that it goes with.
+    def store(self, fname, size, mtime, digest, report):
+        self.connection.execute('INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?)', (os.path.abspath(fname), size, mtime, digest, json.dumps(dict(report.toDict(), signatures=currentFingerprint)), self.now))
+
+    # Keeps the cache under its size limit, and then saves everything to disk.
+    # Entries for images that no longer exist go first, and after that, the ones that have gone unused the longest.
+    def close(self):
+        count = self.connection.execute('SELECT COUNT(*) FROM images').fetchone()[0]
+        if count > self.maxEntries:
+            for (path,) in self.connection.execute('SELECT path FROM images WHERE used < ?', (self.now,)).fetchall():
+                if not os.path.exists(path):
+                    self.connection.execute('DELETE FROM images WHERE path = ?', (path,))
+            self.connection.execute('DELETE FROM images WHERE path IN (SELECT path FROM images ORDER BY used DESC LIMIT -1 OFFSET ?)', (self.maxEntries,))
+        self.connection.commit()
+        self.connection.close()
+
+# Looks up a report by content hash in the cache at cachePath.
+# The worker processes use this to skip the scan for images that changed on the outside but not on the inside. They only ever read the cache, so they open their own connection.
+def lookupCachedHash(cachePath, digest):
+    import sqlite3
+    connection = sqlite3.connect(cachePath)
+    try:
+        row = connection.execute('SELECT report FROM images WHERE hash = ? LIMIT 1', (digest,)).fetchone()
+    finally:
+        connection.close()
+    if row is None:
+        return None
+    return loadCachedReport(row[0])
+
+# Looks up the content hash that the cache at cachePath has for an image, or None if it doesn't have one. Like lookupCachedHash, this opens its own connection.
+def lookupStoredHash(cachePath, fname):
+    import sqlite3
+    connection = sqlite3.connect(cachePath)
+    try:
+        row = connection.execute('SELECT hash FROM images WHERE path = ?', (os.path.abspath(fname),)).fetchone()
+    finally:
+        connection.close()
+    return None if row is None else row[0]
+
+# Turns a report from the cache back into an ImageReport.
+# Reports are saved along with the fingerprint of the routine signatures that they were made with, and if the signatures have changed since then, the report can't be trusted and None is returned instead.
+def loadCachedReport(text):
+    values = json.loads(text)
+    if values.pop('signatures', None) != currentFingerprint:
+        return None
+    # Reports from before every tool entry got indexed don't have them, so they can't be used for hard disks.
+    if 'toolEntries' not in values:
+        return None
+    return ImageReport.fromDict(values)
+
+# An index of what we know about every image we've seen, kept in a SQLite database so that questions like "which disks are serialized to SN 12345?" can be answered without rescanning anything.
+# Each image's serial number, tool number, disk type, and patch serial numbers get their own indexed columns, and the full report is kept too, so that unchanged images don't need to be read again when the catalog gets refreshed.
+# Like the analysis cache, an entry is only trusted if the image's size and modification time still match, but entries never get evicted; they stay until their images disappear.
+class SerialCatalog:
+    def __init__(self, path):
+        import sqlite3
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS images (path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, diskKind TEXT, diskType TEXT, volumeName TEXT, toolNumber INTEGER, serial INTEGER, bozo INTEGER, patched INTEGER, report TEXT)')
+        # Images can be patched with more than one serial number, so those get a table of their own.
+        self.connection.execute('CREATE TABLE IF NOT EXISTS patchSerials (path TEXT, serial INTEGER)')
+        for column in ('serial', 'toolNumber', 'diskKind', 'diskType'):
+            self.connection.execute('CREATE INDEX IF NOT EXISTS imagesBy' + column[0].upper() + column[1:] + ' ON images (' + column + ')')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS patchSerialsBySerial ON patchSerials (serial)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS patchSerialsByPath ON patchSerials (path)')
+        # Hard disks can have dozens of tools on them, each with its own serial number, so every tool entry gets a row in a table of its own too.
+        created = self.connection.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'tools'").fetchone() is None
+        self.connection.execute('CREATE TABLE IF NOT EXISTS tools (path TEXT, toolNumber INTEGER, serial INTEGER, bozo INTEGER)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS toolsBySerial ON tools (serial)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS toolsByToolNumber ON tools (toolNumber)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS toolsByPath ON tools (path)')
+        # Catalogs from before the tools table existed already have every tool entry in their reports, so it gets filled in from those.
+        if created:
+            for path, text in self.connection.execute('SELECT path, report FROM images').fetchall():
+                self.connection.executemany('INSERT INTO tools VALUES (?, ?, ?, ?)', catalogToolRows(path, json.loads(text).get('toolEntries', [])))
+
+    # Looks up the report for an image, but only if it hasn't changed since it was cataloged (and was cataloged with the same routine signatures).
+    def lookup(self, fname):
+        stat = os.stat(fname)
+        row = self.connection.execute('SELECT size, mtime, report FROM images WHERE path = ?', (os.path.abspath(fname),)).fetchone()
+        if row is None or row[0] != stat.st_size or row[1] != stat.st_mtime_ns:
+            return None
+        return loadCachedReport(row[2])
+
+    # Adds an image to the catalog, or brings its entry up to date.
+    def store(self, fname, size, mtime, report):
+        path = os.path.abspath(fname)
+        toolNumber = int(report.toolNumber) if report.isTool and report.toolNumber.isdigit() else None
+        bozo = int(report.bozo) if report.isTool and not report.isLisaWrite2 else None
+        self.connection.execute('DELETE FROM patchSerials WHERE path = ?', (path,))
+        self.connection.execute('INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (path, size, mtime, report.diskKind, diskType(report), report.volumeName, toolNumber, reportSerial(report), bozo, int(bool(report.patchedRoutines)), json.dumps(dict(report.toDict(), signatures=currentFingerprint))))
+        self.connection.executemany('INSERT INTO patchSerials VALUES (?, ?)', [(path, serial) for serial in sorted(set(routine[1] for routine in report.patchedRoutines))])
+        self.connection.execute('DELETE FROM tools WHERE path = ?', (path,))
+        self.connection.executemany('INSERT INTO tools VALUES (?, ?, ?, ?)', catalogToolRows(path, report.toolEntries))
+
+    # Removes the entries for images that no longer exist, but only inside the given directories, so that images on a drive that isn't plugged in right now don't get forgotten.
+    def prune(self, directories):
+        for directory in directories:
+            prefix = os.path.join(os.path.abspath(directory), '')
+            for (path,) in self.connection.execute('SELECT path FROM images WHERE substr(path, 1, ?) = ?', (len(prefix), prefix)).fetchall():
+                if not os.path.exists(path):
+                    self.connection.execute('DELETE FROM images WHERE path = ?', (path,))
+                    self.connection.execute('DELETE FROM patchSerials WHERE path = ?', (path,))
+                    self.connection.execute('DELETE FROM tools WHERE path = ?', (path,))
+
+    # Finds every image that meets all of the conditions from parseQuery, in order of path.
+    # Returns a list of their paths and reports.
+    def query(self, conditions, parameters):
+        sql = 'SELECT path, report FROM images'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        results = []
+        for path, text in self.connection.execute(sql + ' ORDER BY path', parameters):
+            values = json.loads(text)
+            values.pop('signatures', None)
+            results.append((path, ImageReport.fromDict(values)))
+        return results
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+# Returns the catalog's rows for every tool entry in a report, leaving out LisaWrite 2, which doesn't have a serial number or bozo bits.
+def catalogToolRows(path, toolEntries):
+    return [(path, int(toolNumber) if toolNumber.isdigit() else None, serial, int(bozo)) for offset, toolNumber, serial, bozo, lisaWrite2 in toolEntries if not lisaWrite2]
+
+# Turns a yes or no from a query into a number for the catalog.
+def parseFlag(text):
+    if text.lower() in ('yes', 'true', '1'):
+        return 1
+    if text.lower() in ('no', 'false', '0'):
+        return 0
+    raise ValueError(text)
+
+# Everything that a catalog query can look for, with the condition that each one adds and how to turn its value into the right type.
+# Serial numbers and tool numbers match any of the tools on a hard disk, as well as the disk's own.
+queryFilters = {
+    'serial': ('(serial = ? OR path IN (SELECT path FROM tools WHERE serial = ?))', int),
+    'tool': ('(toolNumber = ? OR path IN (SELECT path FROM tools WHERE toolNumber = ?))', int),
+    'type': ('diskType = ?', str),
+    'kind': ('diskKind = ?', str),
+    'volume': ('volumeName = ?', str),
+    'patched': ('patched = ?', parseFlag),
+    'patchserial': ('path IN (SELECT path FROM patchSerials WHERE serial = ?)', int),
+    'bozo': ('bozo = ?', parseFlag),
+    'path': ('path GLOB ?', str),
+}
+
+# Parses a catalog query like "serial=12345" or "type=installDisk1,patched=yes" into a list of SQL conditions and their parameters.
+def parseQuery(value):
+    conditions = []
+    parameters = []
+    for term in value.split(','):
+        if not term.strip():
+            continue
+        key, separator, text = term.strip().partition('=')
+        if not separator or key not in queryFilters:
+            raise argparse.ArgumentTypeError('"' + term.strip() + '" isn\'t a valid query term! Use ' + ', '.join([name + '=value' for name in queryFilters]) + '.')
+        condition, convert = queryFilters[key]
+        # Conditions that look in more than one place need the value once for each of them.
+        try:
+            parameters.extend([convert(text)] * condition.count('?'))
+        except ValueError:
+            raise argparse.ArgumentTypeError('"' + text + '" isn\'t a valid value for ' + key + '!')
+        conditions.append(condition)
+    return conditions, parameters
+
+# Shows every image in the catalog that matches the query, along with its status as of when it was cataloged.
+def queryCatalog(args):
+    catalog = SerialCatalog(args.catalog)
+    try:
+        results = catalog.query(*args.query)
+    finally:
+        catalog.close()
+    timing = {'read': 0.0, 'scan': 0.0, 'write': 0.0}
+    for path, report in results:
+        messages = planEdits(path, report, args)[1]
+        record = makeRecord(path, report, args, messages, 0, timing)
+        if record is not None:
+            print(json.dumps(record), flush=True)
+        else:
+            for message in messages:
+                print(message)
+    if args.format == 'text':
+        print('Found ' + str(len(results)) + ' matching image(s) in ' + args.catalog + '.')
+
+# Hashes the contents of an image for the analysis cache.
+# Contents that aren't in memory get hashed a chunk at a time.
+def hashContents(contents):
+    digest = hashlib.blake2b(digest_size=20)
+    if isinstance(contents, ImageReader):
+        for position in range(0, len(contents), contents.chunkSize):
+            digest.update(contents[position:(position + contents.chunkSize)])
+    else:
+        digest.update(contents)
+    return digest.hexdigest()
+
+# Does everything that the user asked for to a single image.
+# Every requested operation gets planned out against the same report, and all of the resulting edits are applied together.
+# This way, each image gets read exactly once and written at most once, no matter how many options were given.
+# If the report came out of the analysis cache, the image doesn't need to be scanned, and if we're only showing its status, it doesn't even need to be read.
+# duplicates is a list of other images with exactly the same contents, which get the same changes without having to be read or analyzed themselves.
+# This runs in the worker processes, so rather than printing anything, it returns a list with a result for the image and then for each of its duplicates.
+# Each result has the image's name, the number of bytes that were written to it, the messages to show the user,
+# (if the cache or the catalog is in use) a new entry for the image, or None if the cached one is still good, (if we're writing JSON Lines) the image's record, or None otherwise,
+# and (with -profile) the image's profile, or None otherwise.
+def processImage(fname, options, report=None, duplicates=()):
+    # Worker processes might not have loaded the user's routine signatures yet.
+    for path in options.signatures:
+        loadSignatures(path)
+    # Keep track of how long we spend reading, scanning, and writing the image.
+    timing = {'read': 0.0, 'scan': 0.0, 'write': 0.0}
+    # If no options were given, then we just want to provide info about the image without changing anything.
+    if report is not None and not isModifying(options):
+        results = []
+        for name in [fname] + list(duplicates):
+            startProfile(options)
+            messages = planEdits(name, report, options)[1]
+            results.append(finishResult(name, 0, messages, None, makeRecord(name, report, options, messages, 0, timing), None))
+        return results
+    startProfile(options)
+    # Open the disk image and read its contents. Images that are bigger than a chunk (hard disk images, mostly) are read a chunk at a time as they're needed instead, so memory use stays the same no matter how big they are.
+    startTime = time.perf_counter()
+    with open(fname, 'rb') as image:
+        stat = os.fstat(image.fileno())
+        if stat.st_size > options.chunksize:
+            contents = ImageReader(image, options.chunksize)
+        else:
+            contents = image.read()
+            if profile is not None:
+                profile.count('reads')
+                profile.count('bytesRead', len(contents))
+        if profile is not None:
+            profile.count('filesOpened')
+        # If we don't already have a report, see whether the cache has one for the same contents before going to the trouble of analyzing the image.
+        # A report that was found by the image's path, size, and modification time alone can be out of date if the image was rewritten without either of those changing
+        # (on filesystems that only keep modification times to the nearest couple of seconds, say), so before planning any changes with it, make sure the contents still match it.
+        # The catalog doesn't keep content hashes, so without the cache, there's no way to check, and the image gets analyzed again.
+        digest = None
+        if options.cache is not None:
+            digest = hashContents(contents)
+            if report is not None and lookupStoredHash(options.cache, fname) != digest:
+                report = None
+            if report is None:
+                report = lookupCachedHash(options.cache, digest)
+        else:
+            report = None
+        readTime = time.perf_counter()
+        timing['read'] = readTime - startTime
+        # The image's Disk Copy 4.2 layout gets worked out once, and used both for analyzing it and for updating its checksums.
+        disk = parseDiskCopy(contents)
+        if report is None:
+            report = analyze(contents, disk)
+        scanTime = time.perf_counter()
+        edits, messages = planEdits(fname, report, options)
+        # If there's anything to change, work out exactly which bytes need to change.
+        # Disk Copy 4.2 images also need their checksums brought up to date so that emulators will still accept them.
+        changes = []
+        if edits:
+            changes = finishEdits(contents, edits, disk)
+        # If we're making deltas, they need the bytes that the changes replace, so grab those while the image is still open.
+        delta = None
+        if changes and options.delta is not None:
+            delta = makeDelta(fname, contents, changes)
+        timing['scan'] = time.perf_counter() - readTime
+        if profile is not None:
+            profile.seconds['read'] += timing['read']
+            profile.seconds['scan'] += scanTime - readTime
+            profile.seconds['plan'] += time.perf_counter() - scanTime
+    # The records describe the images as we found them, before any of the changes.
+    oldReport = report
+    record = makeRecord(fname, report, options, messages, 0, timing)
+    # If we're making deltas, save the changes to one instead of changing the image.
+    # The number of bytes that the delta changes gets reported in place of the number of bytes written, but the record still says that nothing was written.
+    written = 0
+    mismatches = None
+    if delta is not None:
+        written = saveImageDelta(fname, options, delta, messages)
+        changes = []
+        record = makeRecord(fname, report, options, messages, 0, timing)
+    # Otherwise, write all of the changed bytes back to the file in one go, and read them back again if we're verifying.
+    # With -journal, they go to a staging copy of the image instead, which replaces it at the next commit point.
+    if changes:
+        writeTime = time.perf_counter()
+        target = fname
+        if options.journal is not None:
+            target = stageEdits(fname, changes, options)
+        written = saveEdits(target, changes)
+        mismatches = verifyImage(fname, changes, options, messages, target)
+        timing['write'] = time.perf_counter() - writeTime
+        if mismatches is not None:
+            record = makeRecord(fname, report, options, messages, 0, timing)
+        # The cached report is out of date now, so analyze the new contents to keep the cache current.
+        if keepsReports(options) and written > 0:
+            if isinstance(contents, ImageReader):
+                with open(target, 'rb') as image:
+                    contents = ImageReader(image, options.chunksize)
+                    digest = hashContents(contents)
+                    report = analyze(contents)
+            else:
+                contents = patchRange(contents, 0, changes)
+                digest = hashContents(contents)
+                report = analyze(contents)
+            # Renaming the staging file keeps its modification time, so it's what the image will look like once it's been committed.
+            stat = os.stat(target)
+            if profile is not None:
+                profile.seconds['scan'] += time.perf_counter() - writeTime - timing['write']
+    if profile is not None:
+        profile.seconds['write'] += timing['write']
+    if record is not None and delta is None:
+        record['bytesWritten'] = written
+        record['seconds']['write'] = round(timing['write'], 6)
+    entry = None
+    if keepsReports(options):
+        entry = (stat.st_size, stat.st_mtime_ns, digest, report.toDict())
+    results = [finishResult(fname, written, messages, entry, record, mismatches)]
+    # Now give each of the duplicates the same treatment, using what we just worked out for this image.
+    for name in duplicates:
+        results.append(processDuplicate(name, fname, options, oldReport, report, changes, digest, delta))
+    return results
+
+# Runs processImage for an image and its duplicates, but if anything goes wrong with the image, returns an error result for each of them instead of stopping the whole batch.
+# With -journal, a staging file that the image might have left behind gets deleted, since its changes are never going to be committed.
+def processGroup(fname, options, report=None, duplicates=()):
+    try:
+        return processImage(fname, options, report, duplicates)
+    except Exception as error:
+        finishProfile()
+        results = []
+        for name in [fname] + list(duplicates):
+            if options.journal is not None and os.path.lexists(name + stagingExtension):
+                os.remove(name + stagingExtension)
+            results.append(errorResult(name, options, 'Unable to process this image', error))
+        return results
+
+# Builds the result for an image that couldn't be processed at all, with a message saying why. If we're writing JSON Lines, it gets a record of its own too.
+def errorResult(fname, options, problem, error):
+    reason = str(error) or type(error).__name__
+    message = Color.BLUE + fname + ': ' + Color.RED + 'ERROR - ' + problem + ': ' + reason + Color.END
+    record = None
+    if getattr(options, 'format', 'text') == 'jsonl':
+        record = {'image': fname, 'error': reason, 'messages': [colorPattern.sub('', message)[(len(fname) + 2):].strip()], 'bytesWritten': 0}
+    return fname, 0, [message], None, record, None, None
+
+# Applies the changes that were made to the image source to one of its duplicates, which had exactly the same contents before the changes.
+# Normally, the changed bytes get written to the duplicate just like they were to source, but if the user asked for it, the duplicate gets replaced with a hard link or a reflink to source instead.
+# oldReport and newReport describe the contents before and after the changes, and digest is the hash of the new contents if the cache is in use.
+# If we're making deltas, delta is the one for source, and the duplicate gets a copy of it instead.
+# Returns the same kind of result as processImage.
+def processDuplicate(fname, source, options, oldReport, newReport, changes, digest, delta=None):
+    startProfile(options)
+    timing = {'read': 0.0, 'scan': 0.0, 'write': 0.0}
+    edits, messages = planEdits(fname, oldReport, options)
+    written = 0
+    mismatches = None
+    # With -journal, the changes get written to a staging copy of the image instead, which replaces it at the next commit point.
+    target = fname
+    if delta is not None:
+        written = saveImageDelta(fname, options, dict(delta, image=fname), messages)
+    elif changes:
+        writeTime = time.perf_counter()
+        if options.link is None:
+            if options.journal is not None:
+                target = stageEdits(fname, changes, options)
+            written = saveEdits(target, changes)
+        else:
+            try:
+                linkDuplicate(fname, source, options.link)
+                messages.append(Color.BLUE + fname + ': ' + Color.GREEN + 'Replaced with a ' + linkNames[options.link] + ' to ' + source + '.' + Color.END)
+            except OSError as error:
+                # If we can't link it (say, because it's on a different filesystem from source), just write the changes to it instead.
+                written = saveEdits(fname, changes)
+                messages.append(Color.BLUE + fname + ': ' + Color.YELLOW + 'Unable to make a ' + linkNames[options.link] + ' to ' + source + ' (' + (error.strerror or str(error)) + '), so the changes were written instead.' + Color.END)
+        # Links share source's contents, which were already verified, so only duplicates that got the changes written to them need checking.
+        if written > 0:
+            mismatches = verifyImage(fname, changes, options, messages, target)
+        timing['write'] = time.perf_counter() - writeTime
+        if profile is not None:
+            profile.seconds['write'] += timing['write']
+    record = makeRecord(fname, oldReport, options, messages, 0 if delta is not None else written, timing)
+    entry = None
+    if keepsReports(options):
+        stat = os.stat(target)
+        entry = (stat.st_size, stat.st_mtime_ns, digest, newReport.toDict())
+    return finishResult(fname, written, messages, entry, record, mismatches)
+
+# Wraps up the result for an image, adding the profile of the image (if we're profiling) to the end of it, and to its record too.
+# mismatches is what verifyImage found, or None if the image wasn't verified; records say whether it passed.
+def finishResult(fname, written, messages, entry, record, mismatches):
+    stats = finishProfile()
+    if record is not None:
+        if stats is not None:
+            record['profile'] = stats
+        if mismatches is not None:
+            record['verified'] = not mismatches
+            record['mismatches'] = [{'offset': offset, 'length': length} for offset, length in mismatches]
+    return fname, written, messages, entry, record, stats, mismatches
+
+# Saves the delta for an image into the delta directory and adds a message saying so.
+# Returns the number of bytes that the delta changes.
+def saveImageDelta(fname, options, delta, messages):
+    path = deltaPath(options.delta, fname)
+    saveDelta(path, delta)
+    messages.append(Color.BLUE + fname + ': ' + Color.GREEN + 'Saved the changes to ' + path + ' instead of changing the image.' + Color.END)
+    return sum([len(new) for offset, old, new in delta['changes']]) // 2
+
+# What each kind of link is called in the messages.
+linkNames = {'hard': 'hard link', 'reflink': 'reflink'}
+
+# The ioctl that asks Linux to make a reflink (a copy that shares its blocks with the original until one of them changes).
+ficlone = 0x40049409
+
+# Replaces fname with a hard link or a reflink to source, depending on kind.
+# The link is made under a temporary name first and then moved into place, so that fname is never missing or half-made.
+def linkDuplicate(fname, source, kind):
+    temporary = fname + '.losserialtool-link'
+    try:
+        if kind == 'hard':
+            os.link(source, temporary)
+        else:
+            # fcntl only exists on Unix-like systems, and reflinks are only a thing on Linux filesystems that support them (like Btrfs and XFS), so only import it when it's needed.
+            import fcntl
+            with open(source, 'rb') as original, open(temporary, 'wb') as copy:
+                fcntl.ioctl(copy.fileno(), ficlone, original.fileno())
+        os.replace(temporary, fname)
+    except OSError:
+        if os.path.lexists(temporary):
+            os.remove(temporary)
+        raise
+
+# Hashes a whole image file, reading it a chunk at a time if it's bigger than chunkSize.
+def hashImage(fname, chunkSize):
+    with open(fname, 'rb') as image:
+        if os.fstat(image.fileno()).st_size > chunkSize:
+            return hashContents(ImageReader(image, chunkSize))
+        return hashContents(image.read())
+
+# Sorts images into groups with exactly the same contents, so that each set of duplicates only needs to be analyzed and changed once.
+# Only images that are the same size as another image need to be hashed, since images of different sizes can't possibly be the same.
+# Returns a list of groups, each of which is a list of images in the order they were given, ordered by their first image.
+def groupDuplicates(images, chunkSize):
+    sizes = {fname: os.path.getsize(fname) for fname in images}
+    sameSize = {}
+    for fname in images:
+        sameSize[sizes[fname]] = sameSize.get(sizes[fname], 0) + 1
+    keys = {}
+    for fname in images:
+        if sameSize[sizes[fname]] > 1:
+            keys[fname] = hashImage(fname, chunkSize)
+        else:
+            keys[fname] = fname
+    groups = {}
+    for fname in images:
+        groups.setdefault(keys[fname], []).append(fname)
+    return list(groups.values())
+
+# The kinds of archives that we can find images in. Tarballs can be compressed with any of the compression methods that tarfile knows about.
+archiveExtensions = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+# Checks whether a file is an archive of disk images, going by its extension.
+def isArchive(fname):
+    return fname.lower().endswith(archiveExtensions)
+
+# Does whatever the user asked for to every image inside an archive, reading each one straight out of the archive instead of extracting it first.
+# If we're only showing the images' status, nothing gets written anywhere. Otherwise, a new copy of the archive with the changed images in it gets written to the archive directory,
+# and the original archive is left alone. If nothing needs to change, no new archive gets written.
+# Yields the same kind of result as processImage for each image, followed by a result for the archive itself that has a message saying what happened to it.
+def processArchive(fname, options):
+    outputName = None
+    if isModifying(options):
+        if options.delta is not None:
+            yield archiveResult(fname, options, Color.BLUE + fname + ': ' + Color.RED + "ERROR - Changes to images inside archives can't be saved as deltas." + Color.END)
+            return
+        if options.archivedir is None:
+            yield archiveResult(fname, options, Color.BLUE + fname + ': ' + Color.RED + 'ERROR - Images inside archives can only be changed with -archivedir, which says where to put the new archive.' + Color.END)
+            return
+        outputName = os.path.join(options.archivedir, os.path.basename(fname))
+        if os.path.abspath(outputName) == os.path.abspath(fname):
+            yield archiveResult(fname, options, Color.BLUE + fname + ': ' + Color.RED + "ERROR - The new archive can't replace the original one; pick a different -archivedir." + Color.END)
+            return
+        os.makedirs(options.archivedir, exist_ok=True)
+    # The new archive gets written under a temporary name, and only takes the place of the real one once it's finished, so that there's never a half-written archive lying around.
+    temporary = None if outputName is None else outputName + '.losserialtool-archive'
+    # Like sqlite3, these only get imported when they're needed.
+    import zipfile
+    import tarfile
+    try:
+        if fname.lower().endswith('.zip'):
+            changed = yield from processZip(fname, temporary, options)
+        else:
+            changed = yield from processTar(fname, temporary, options)
+    except (OSError, EOFError, zipfile.BadZipFile, tarfile.TarError) as error:
+        if temporary is not None and os.path.exists(temporary):
+            os.remove(temporary)
+        yield archiveResult(fname, options, Color.BLUE + fname + ': ' + Color.RED + 'ERROR - Unable to read this archive: ' + str(error) + Color.END)
+        return
+    if temporary is None:
+        return
+    if changed == 0:
+        os.remove(temporary)
+        yield archiveResult(fname, options, Color.BLUE + fname + ': ' + Color.GREEN + 'No images in this archive needed to change, so no new archive was written.' + Color.END)
+    else:
+        os.replace(temporary, outputName)
+        yield archiveResult(fname, options, Color.BLUE + fname + ': ' + Color.GREEN + 'Wrote a new archive with ' + str(changed) + ' changed image(s) to ' + outputName + '.' + Color.END, outputName, changed)
+
+# Builds the result for an archive as a whole, with a message saying what happened to it. If we're writing JSON Lines, it gets a record of its own too.
+def archiveResult(fname, options, message, output=None, changed=0):
+    record = None
+    if getattr(options, 'format', 'text') == 'jsonl':
+        record = {'archive': fname, 'output': output, 'changedImages': changed, 'messages': [colorPattern.sub('', message)[(len(fname) + 2):].strip()]}
+    return fname, 0, [message], None, record, None, None
+
+# Processes the images in a zip archive for processArchive, writing the new archive to output if it isn't None. Returns the number of images that changed.
+# Only the images that change get compressed again; every other member is copied to the new archive exactly as it was.
+def processZip(fname, output, options):
+    import zipfile
+    changed = 0
+    with zipfile.ZipFile(fname) as source:
+        target = zipfile.ZipFile(output, 'w') if output is not None else None
+        try:
+            for info in source.infolist():
+                if info.is_dir() or not isDiskImage(info.filename):
+                    if target is not None:
+                        copyZipMember(source, target, info)
+                    continue
+                name = os.path.normpath(os.path.join(fname, info.filename))
+                # Encrypted members and ones that use a compression method that zipfile doesn't support can't be read, but they're still copied to the new archive as they are.
+                try:
+                    with source.open(info) as stream:
+                        result, contents, spool = processMember(name, stream, info.file_size, options)
+                except (RuntimeError, NotImplementedError) as error:
+                    finishProfile()
+                    yield errorResult(name, options, 'Unable to read this image from the archive', error)
+                    if target is not None:
+                        copyZipMember(source, target, info)
+                    continue
+                try:
+                    yield result
+                    if target is None:
+                        continue
+                    if result[1] == 0:
+                        copyZipMember(source, target, info)
+                        continue
+                    changed += 1
+                    newInfo = copy.copy(info)
+                    if spool is None:
+                        target.writestr(newInfo, bytes(contents))
+                    else:
+                        spool.seek(0)
+                        with target.open(newInfo, 'w', force_zip64=True) as member:
+                            shutil.copyfileobj(spool, member, options.chunksize)
+                finally:
+                    if spool is not None:
+                        spool.close()
+        finally:
+            if target is not None:
+                target.close()
+    return changed
+
+# Copies a member of one zip archive to another exactly as it is, without decompressing it and compressing it again.
+# The member's compressed data starts right after its local header, which is 30 bytes long plus the length of its name and extra field.
+def copyZipMember(source, target, info):
+    header = readAt(source.fp, info.header_offset, 30)
+    nameLength, extraLength = struct.unpack_from('<HH', header, 26)
+    dataStart = info.header_offset + 30 + nameLength + extraLength
+    info = copy.copy(info)
+    # The sizes and CRC go in the new local header, so the member doesn't need a data descriptor after it anymore.
+    info.flag_bits &= ~0x08
+    target.fp.seek(target.start_dir)
+    info.header_offset = target.fp.tell()
+    target.fp.write(info.FileHeader())
+    for position in range(0, info.compress_size, 1048576):
+        target.fp.write(readAt(source.fp, dataStart + position, min(1048576, info.compress_size - position)))
+    target.filelist.append(info)
+    target.NameToInfo[info.filename] = info
+    target.start_dir = target.fp.tell()
+
+# Processes the images in a tarball for processArchive, writing the new tarball to output if it isn't None. Returns the number of images that changed.
+# Tarballs are read (and written) as a stream, so every member gets copied to the new tarball as we go. Compressed tarballs are one big compressed stream, so the new one has to be compressed all over again.
+def processTar(fname, output, options):
+    import tarfile
+    compression = ''
+    for extensions, method in ((('.gz', '.tgz'), 'gz'), (('.bz2', '.tbz2'), 'bz2'), (('.xz', '.txz'), 'xz')):
+        if fname.lower().endswith(extensions):
+            compression = method
+    changed = 0
+    with tarfile.open(fname, 'r|' + compression) as source:
+        target = tarfile.open(output, 'w|' + compression) if output is not None else None
+        try:
+            for member in source:
+                if not member.isfile() or not isDiskImage(member.name):
+                    if target is not None:
+                        target.addfile(member, source.extractfile(member) if member.isfile() else None)
+                    continue
+                result, contents, spool = processMember(os.path.normpath(os.path.join(fname, member.name)), source.extractfile(member), member.size, options)
+                try:
+                    yield result
+                    if target is None:
+                        continue
+                    if result[1] > 0:
+                        changed += 1
+                    if spool is None:
+                        target.addfile(member, io.BytesIO(contents))
+                    else:
+                        spool.seek(0)
+                        target.addfile(member, spool)
+                finally:
+                    if spool is not None:
+                        spool.close()
+        finally:
+            if target is not None:
+                target.close()
+    return changed
+
+# Reads an image out of an archive and does whatever the user asked for to it, in memory.
+# Images that are bigger than a chunk get copied into an anonymous temporary file instead, and are read from there a chunk at a time, since we need to be able to jump around in them.
+# Returns the same kind of result as processImage, along with the image's contents (with any changes made to them) and the temporary file, or None if there isn't one, which the caller has to close.
+def processMember(name, stream, size, options):
+    startProfile(options)
+    timing = {'read': 0.0, 'scan': 0.0, 'write': 0.0}
+    startTime = time.perf_counter()
+    spool = None
+    if size > options.chunksize:
+        import tempfile
+        spool = tempfile.TemporaryFile()
+        shutil.copyfileobj(stream, spool, options.chunksize)
+        spool.flush()
+        contents = ImageReader(spool, options.chunksize)
+    else:
+        contents = stream.read()
+        if profile is not None:
+            profile.count('reads')
+            profile.count('bytesRead', len(contents))
+    readTime = time.perf_counter()
+    timing['read'] = readTime - startTime
+    report = analyze(contents)
+    scanTime = time.perf_counter()
+    edits, messages = planEdits(name, report, options)
+    changes = []
+    if edits:
+        changes = finishEdits(contents, edits)
+    timing['scan'] = time.perf_counter() - readTime
+    if profile is not None:
+        profile.seconds['read'] += timing['read']
+        profile.seconds['scan'] += scanTime - readTime
+        profile.seconds['plan'] += time.perf_counter() - scanTime
+    # The changes get made to our copy of the image, which is what goes into the new archive.
+    written = 0
+    if changes:
+        writeTime = time.perf_counter()
+        if spool is None:
+            contents = patchRange(contents, 0, changes)
+            written = sum([len(data) for offset, data in changes])
+        else:
+            written = writeChanges(spool, changes)
+        timing['write'] = time.perf_counter() - writeTime
+        if profile is not None:
+            profile.seconds['write'] += timing['write']
+    return finishResult(name, written, messages, None, makeRecord(name, report, options, messages, written, timing), None), contents, spool
+
+# Matches the escape sequences that the Color codes are made of, so that they can be taken back out of messages.
+colorPattern = re.compile('\x1b\\[[0-9;]*m')
+
+# Builds the JSON Lines record for an image from its report: what kind of disk it is, its serialization and patch state, what we were asked to do to it and what happened,
+# and how many seconds we spent reading, scanning, and writing it. Returns None unless we're writing JSON Lines.
+def makeRecord(fname, report, options, messages, written, timing):
+    if getattr(options, 'format', 'text') != 'jsonl':
+        return None
+    patchSerials = sorted(set(routine[1] for routine in report.patchedRoutines))
+    actions = [name for name in ('unpatch', 'deserialize', 'setbozo', 'clearbozo') if getattr(options, name)]
+    if options.patch is not None:
+        actions.insert(0, 'patch')
+    record = {
+        'image': fname,
+        'diskKind': report.diskKind,
+        'volumeName': report.volumeName,
+        'diskType': diskType(report),
+        'toolNumber': report.toolNumber if report.isTool else None,
+        'serial': reportSerial(report),
+        'bozo': report.bozo if report.isTool and not report.isLisaWrite2 else None,
+        'patched': bool(report.patchedRoutines),
+        'patchSerials': patchSerials,
+        'originalRoutines': len(report.originalRoutines),
+        'patchedRoutines': len(report.patchedRoutines),
+        'routineSignatures': sorted(set(report.routineNames.values())),
+        'actions': actions,
+        'messages': [colorPattern.sub('', message)[(len(fname) + 2):].strip() for message in messages],
+        'bytesWritten': written,
+        'seconds': {name: round(value, 6) for name, value in timing.items()},
+    }
+    # Hard disks get a list of every tool on them as well.
+    if getattr(options, 'harddisk', False):
+        record['tools'] = [{'offset': offset, 'toolNumber': toolNumber, 'serial': None if lisaWrite2 else serial, 'bozo': None if lisaWrite2 else bozo, 'lisaWrite2': lisaWrite2} for offset, toolNumber, serial, bozo, lisaWrite2 in report.toolEntries]
+    return record
+
+# Returns the serial number that the report's disk is serialized with (0 if it's deserialized), or None if it's not a disk that gets serialized at all.
+def reportSerial(report):
+    if report.isTool and not report.isLisaWrite2:
+        return report.toolSerial
+    if report.isOfficeSystem:
+        return report.officeSerial
+    return None
+
+# Sums up what kind of LOS disk the report describes, as a short name for the JSON Lines records.
+def diskType(report):
+    if report.isLisaWrite2:
+        return 'lisaWrite2'
+    if report.isTool:
+        return 'tool'
+    if report.isOfficeSystem:
+        return 'installDisk1'
+    if report.isOtherOffice:
+        return 'installDisk'
+    if report.isLisaGuide:
+        return 'lisaGuide'
+    return None
+
+# Checks whether a plan (or the command line options) includes any operation that changes images, as opposed to just viewing their status.
+def isModifying(plan):
+    return plan.patch is not None or plan.unpatch or plan.deserialize or plan.clearbozo or plan.setbozo
+
+# Checks whether the options need an up-to-date report for every image afterwards, which they do if we're keeping the analysis cache or the serial catalog.
+def keepsReports(options):
+    return options.cache is not None or options.catalog is not None
+
+# Builds the list of disk images to work on from the paths given on the command line, in a deterministic order.
+# Paths can be image files, directories, or glob patterns. Directories contribute all of their .dc42 and .image files, and if recursive is set, so do all of the directories inside them.
+def collectImages(paths, recursive):
+    images = []
+    seen = set()
+    for path in paths:
+        # Expand glob patterns ourselves, since not every shell does it for us.
+        if glob.has_magic(path):
+            matches = sorted(glob.glob(path, recursive=recursive))
+        else:
+            matches = [path]
+        for match in matches:
+            if os.path.isdir(match):
+                found = []
+                if recursive:
+                    for directory, subdirectories, files in os.walk(match):
+                        subdirectories.sort()
+                        found += [os.path.join(directory, fname) for fname in sorted(files)]
+                else:
+                    found = [os.path.join(match, fname) for fname in sorted(os.listdir(match))]
+                found = [fname for fname in found if os.path.isfile(fname) and isDiskImage(fname)]
+            # Files that were named explicitly (or matched a glob) get used regardless of their extension.
+            elif os.path.isfile(match):
+                found = [match]
+            else:
+                found = []
+            for fname in found:
+                fname = os.path.normpath(fname)
+                if fname not in seen:
+                    seen.add(fname)
+                    images.append(fname)
+    return images
+
+# Runs processImage on every group of identical images, spreading them across a pool of worker processes if more than one job was requested.
+# The first image in each group is the one that actually gets processed, and the rest are its duplicates. Without deduplication, every group only has one image in it.
+# Any reports that we already have from the analysis cache get handed to processImage along with their groups.
+# The results come back in the same order as the groups, no matter which worker finishes first, so the output is always the same.
+def runBatch(groups, options, reports):
+    jobs = options.jobs
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    if jobs == 1 or len(groups) < 2:
+        for group, report in zip(groups, reports):
+            yield processGroup(group[0], options, report, group[1:])
+        return
+    # Like sqlite3, this only gets imported when it's needed.
+    import concurrent.futures
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        # Hand the images out in chunks so that the workers don't spend all their time waiting on us for small images.
+        chunkSize = max(1, min(64, len(groups) // (jobs * 4)))
+        yield from executor.map(processGroup, [group[0] for group in groups], itertools.repeat(options), reports, [group[1:] for group in groups], chunksize=chunkSize)
+
+# Writes a patched copy of each image to the overlay destination instead of changing the images. The originals are only ever read, through a read-only mmap.
+# The destination can be a directory (each copy goes inside it under its image's name), a FIFO (which an emulator can read the copy from without it ever landing on disk), or '-' for standard output.
+# Only a directory can take more than one image.
+def exportOverlays(images, options):
+    import sys
+    toDirectory = os.path.isdir(options.overlay)
+    if not toDirectory and len(images) != 1:
+        print(Color.BLUE + options.overlay + ': ' + Color.RED + 'ERROR - Option -overlay needs a directory unless there\'s exactly one image, but there are ' + str(len(images)) + '.' + Color.END)
+        return
+    # Every copy goes straight into the directory under its image's name, so two images with the same name (in different directories, say) would overwrite each other's copies.
+    names = [os.path.basename(fname) for fname in images]
+    clashes = sorted(set([name for name in names if names.count(name) > 1]))
+    if toDirectory and clashes:
+        print(Color.BLUE + options.overlay + ': ' + Color.RED + 'ERROR - Every image needs a different name, since the copies all go in the same directory, but more than one image is named ' + ', '.join(clashes) + '.' + Color.END)
+        return
+    for fname in images:
+        destination = os.path.join(options.overlay, os.path.basename(fname)) if toDirectory else options.overlay
+        timing = {'read': 0.0, 'scan': 0.0, 'write': 0.0}
+        # The original has to stay the way it is, so it can't be its own overlay (which is what would happen with -overlay pointing at the image's own directory).
+        if destination != '-' and os.path.exists(destination) and os.path.samefile(destination, fname):
+            printResult([Color.BLUE + fname + ': ' + Color.RED + 'ERROR - The overlay for this image would replace the image itself; pick a different -overlay destination.' + Color.END], None)
+            continue
+        try:
+            view, messages = openPatchedView(fname, options)
+        except (OSError, ValueError) as error:
+            printResult([Color.BLUE + fname + ': ' + Color.RED + 'ERROR - Unable to read this image: ' + str(error) + Color.END], None)
+            continue
+        try:
+            patched = sum([len(patch) for patch in view.patches])
+            if destination == '-':
+                view.export(sys.stdout.buffer)
+                destination = 'standard output'
+            else:
+                view.export(destination)
+        finally:
+            view.close()
+        if patched > 0:
+            messages.append(Color.BLUE + fname + ': ' + Color.GREEN + 'Wrote the patched image to ' + destination + ', with ' + str(patched) + ' byte(s) patched.' + Color.END)
+        else:
+            messages.append(Color.BLUE + fname + ': ' + Color.GREEN + 'Nothing needed to change, so ' + destination + ' is an exact copy.' + Color.END)
+        # Standard output is taken up by the image itself, so the messages go to standard error in that case.
+        if destination == 'standard output':
+            for message in messages:
+                print(message, file=sys.stderr)
+        else:
+            printResult(messages, makeRecord(fname, view.report, options, messages, 0, timing))
+
+# An image from the template set that stamping makes copies of. It gets analyzed once, and then every copy is planned out from the same report.
+# Big images are read from the file as they're needed, so the file stays open for as long as the template is around.
+class StampTemplate:
+    def __init__(self, fname, chunkSize):
+        self.fname = fname
+        self.image = open(fname, 'rb')
+        if os.fstat(self.image.fileno()).st_size > chunkSize:
+            self.contents = ImageReader(self.image, chunkSize)
+        else:
+            self.contents = self.image.read()
+        # The Disk Copy 4.2 layout stays with the template, so that the checksum state before the changed sectors only gets worked out for the first copy.
+        self.disk = parseDiskCopy(self.contents)
+        self.report = analyze(self.contents, self.disk)
+        # Templates that were read all at once don't need the file anymore.
+        if not isinstance(self.contents, ImageReader):
+            self.image.close()
+
+    def close(self):
+        self.image.close()
+
+# The template set for this process. Each worker process loads its own copy once, when it starts, rather than getting it sent along with every serial number.
+stampTemplates = []
+
+# Loads the template set for stamping, closing any that was loaded before.
+def loadStampTemplates(images, chunkSize):
+    global stampTemplates
+    closeStampTemplates()
+    for fname in images:
+        stampTemplates.append(StampTemplate(fname, chunkSize))
+
+# Closes the template set, if there is one.
+def closeStampTemplates():
+    global stampTemplates
+    for template in stampTemplates:
+        template.close()
+    stampTemplates = []
+
+# Loads the template set in a worker process, and makes sure that it gets closed when the worker exits.
+def loadWorkerStampTemplates(images, chunkSize):
+    import multiprocessing.util
+    loadStampTemplates(images, chunkSize)
+    multiprocessing.util.Finalize(None, closeStampTemplates, exitpriority=10)
+
+# Makes a complete copy of the template set in its own directory, patched with the given serial number (plus anything else that the options ask for).
+# Each image gets copied as-is (which the operating system can do without us having to read it), and then just the bytes that differ get written to the copy.
+# Since the templates were analyzed ahead of time, the only real work left for each copy is updating the checksum of Disk Copy 4.2 images, which only has to be summed from the first changed sector onward.
+# With -verify, the changed bytes in each copy get read back again afterwards.
+# Returns the serial number, the directory that the set went in, the number of images and bytes that were written, the copies that failed verification, and how many seconds it took.
+def stampSet(serial, options):
+    startTime = time.perf_counter()
+    plan = copy.copy(options)
+    plan.patch = serial
+    directory = os.path.join(options.stampdir, str(serial))
+    os.makedirs(directory, exist_ok=True)
+    written = 0
+    failed = []
+    for template in stampTemplates:
+        edits, messages = planEdits(template.fname, template.report, plan)
+        changes = finishEdits(template.contents, edits, template.disk)
+        destination = os.path.join(directory, os.path.basename(template.fname))
+        shutil.copyfile(template.fname, destination)
+        written += saveEdits(destination, changes)
+        if options.verify and changes and verifyEdits(destination, changes):
+            failed.append(destination)
+    return serial, directory, len(stampTemplates), written, failed, time.perf_counter() - startTime
+
+# Stamps a copy of the template set for every serial number, spreading them across a pool of worker processes if more than one job was requested.
+# The template set has to be loaded already; with one job, it's used as it is, and each worker process loads its own.
+# The results come back in the same order as the serial numbers.
+def runStamping(images, options):
+    jobs = options.jobs
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    if jobs == 1 or len(options.stamp) < 2:
+        for serial in options.stamp:
+            yield stampSet(serial, options)
+        return
+    import concurrent.futures
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=loadWorkerStampTemplates, initargs=(images, options.chunksize)) as executor:
+        chunkSize = max(1, min(16, len(options.stamp) // (jobs * 4)))
+        yield from executor.map(stampSet, options.stamp, itertools.repeat(options), chunksize=chunkSize)
+
+# Stamps the images that the user pointed us at, printing what's going to happen to each image first and then a line for every set.
+def stampImages(images, options):
+    names = [os.path.basename(fname) for fname in images]
+    if len(set(names)) != len(names):
+        print(Color.RED + 'ERROR - Every image in the template set needs a different name, since the copies all go in the same directory.' + Color.END)
+        return
+    # The templates only get analyzed once here, for showing what's going to happen and then (with one job) for stamping too.
+    try:
+        loadStampTemplates(images, options.chunksize)
+        stampLoadedImages(images, options)
+    finally:
+        closeStampTemplates()
+
+# Does the work of stampImages once the template set is loaded.
+def stampLoadedImages(images, options):
+    # Show what happens to each template with the first serial number, so that any problems with them show up before we make hundreds of copies.
+    plan = copy.copy(options)
+    plan.patch = options.stamp[0]
+    for template in stampTemplates:
+        for message in planEdits(template.fname, template.report, plan)[1]:
+            if options.format == 'text':
+                print(message)
+    written = 0
+    failures = 0
+    for serial, directory, count, setWritten, failed, seconds in runStamping(images, options):
+        written += setWritten
+        if options.format == 'jsonl':
+            record = {'serial': serial, 'directory': directory, 'images': count, 'bytesWritten': setWritten, 'seconds': round(seconds, 6)}
+            if options.verify:
+                record['verified'] = not failed
+                record['failed'] = failed
+            print(json.dumps(record), flush=True)
+        else:
+            print(Color.BLUE + directory + ': ' + Color.GREEN + 'Stamped ' + str(count) + ' image(s) with serial number ' + str(serial) + '.' + Color.END)
+            for fname in failed:
+                print(Color.BLUE + fname + ': ' + Color.RED + "ERROR - Verification failed: the changed bytes in this copy don't read back the way they were written." + Color.END)
+        failures += len(failed)
+    if options.format == 'text':
+        print('Stamped ' + str(len(options.stamp)) + ' set(s) of ' + str(len(images)) + ' image(s), writing ' + str(written) + ' changed byte(s) on top of the copies.')
+        if options.verify and failures > 0:
+            print(Color.RED + 'ERROR - ' + str(failures) + ' of the copies failed verification.' + Color.END)
+        elif options.verify:
+            print(Color.GREEN + 'Verified the changes to every copy.' + Color.END)
+
+# Turns a list of serial numbers and ranges (like "1000-1099,2000") into a list of serial numbers for -stamp.
+# "@fileName" reads the list from a file instead, where the serial numbers and ranges can be separated by commas, spaces, or new lines.
+def parseSerials(value):
+    if value.startswith('@'):
+        try:
+            with open(value[1:], 'r') as serialFile:
+                value = serialFile.read()
+        except OSError as error:
+            raise argparse.ArgumentTypeError(f"unable to read serial numbers from {value[1:]}: {error.strerror or error}")
+    serials = []
+    for item in value.replace(',', ' ').split():
+        low, dash, high = item.partition('-')
+        if dash:
+            low = validate_positive_int(low)
+            high = validate_positive_int(high)
+            if high < low:
+                raise argparse.ArgumentTypeError(f"serial number range {item} is backwards!")
+            serials += range(low, high + 1)
+        else:
+            serials.append(validate_positive_int(low))
+    if not serials:
+        raise argparse.ArgumentTypeError("no serial numbers given!")
+    return serials
+
+# Watches a directory for new or changed images using inotify, which lets Linux tell us about them as soon as they happen.
+# inotify is only on Linux, and there's no module for it in the standard library, so we talk to the C library directly with ctypes. If any of that fails, this raises OSError.
+class InotifyWatcher:
+    # The kinds of events that we care about: files being written, moved in, or created, and (when recursive) new directories.
+    eventMask = 0x00000002 | 0x00000008 | 0x00000080 | 0x00000100
+    isDirectory = 0x40000000
+
+    def __init__(self, directory, recursive):
+        import ctypes
+        import ctypes.util
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.recursive = recursive
+        self.directories = {}
+        self.addWatch(directory)
+
+    # Starts watching a directory, and if we're recursive, every directory inside it.
+    def addWatch(self, directory):
+        import ctypes
+        watch = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.eventMask)
+        if watch < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_add_watch failed for ' + directory)
+        self.directories[watch] = directory
+        if self.recursive:
+            for entry in os.scandir(directory):
+                if entry.is_dir(follow_symlinks=False):
+                    self.addWatch(entry.path)
+
+    # Waits up to timeout seconds for something to happen, and returns the set of files that were written, moved in, or created.
+    def changes(self, timeout):
+        import select
+        changed = set()
+        ready, unused, unused = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return changed
+        try:
+            buffer = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return changed
+        position = 0
+        # Each event is the watch descriptor, the event mask, a cookie, and the length of the name, followed by the name itself (padded with zeros).
+        while position + 16 <= len(buffer):
+            watch, mask, cookie, length = struct.unpack_from('iIII', buffer, position)
+            name = os.fsdecode(buffer[(position + 16):(position + 16 + length)].rstrip(b'\x00'))
+            position += 16 + length
+            if watch not in self.directories or not name:
+                continue
+            path = os.path.join(self.directories[watch], name)
+            if mask & self.isDirectory:
+                if self.recursive and os.path.isdir(path):
+                    self.addWatch(path)
+                    # Anything that landed in the new directory before we started watching it would get missed otherwise.
+                    changed.update(collectImages([path], True))
+            else:
+                changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+# Watches a directory for new or changed images by looking at it every so often, for systems without inotify.
+# It remembers the size and modification time of every image, and reports the ones that are new or different since the last look.
+class PollingWatcher:
+    def __init__(self, directory, recursive, interval):
+        self.directory = directory
+        self.recursive = recursive
+        self.interval = interval
+        self.snapshot = self.look()
+
+    def look(self):
+        snapshot = {}
+        for fname in collectImages([self.directory], self.recursive):
+            try:
+                stat = os.stat(fname)
+            except OSError:
+                continue
+            snapshot[fname] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    # Waits for the polling interval (or timeout, if that's shorter), then returns the set of images that are new or changed.
+    def changes(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        snapshot = self.look()
+        changed = set([fname for fname, state in snapshot.items() if self.snapshot.get(fname) != state])
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+# Runs forever (or until Ctrl-C), doing whatever the user asked for to every image that shows up in or changes in the watched directory, and logging the results as JSON Lines.
+# Images only get processed once they've stopped changing for a while (the settle time), so that we don't catch them while they're still being written.
+# Everything stays loaded the whole time, so each image only costs what it takes to read, scan, and change it. The images that are already there get processed when we start.
+def watchDirectory(args):
+    args.format = 'jsonl'
+    try:
+        watcher = InotifyWatcher(args.watch, args.recursive)
+        method = 'inotify'
+    except (OSError, AttributeError):
+        watcher = PollingWatcher(args.watch, args.recursive, args.interval)
+        method = 'polling'
+    log = open(args.log, 'a') if args.log is not None else None
+    cache = None
+    if args.cache is not None:
+        cache = AnalysisCache(args.cache, args.cachesize)
+    catalog = None
+    if args.catalog is not None:
+        catalog = SerialCatalog(args.catalog)
+    writeLog(log, {'event': 'watching', 'directory': args.watch, 'method': method})
+    # Every image that we're waiting on, along with its size and modification time the last time we looked and when those last changed.
+    pending = {}
+    for fname in collectImages([args.watch], args.recursive):
+        pending[fname] = (None, 0.0)
+    # The size and modification time that each image had after we were done with it, so that our own changes don't set us off again.
+    finished = {}
+    try:
+        while True:
+            for fname in watcher.changes(args.settle / 2 if pending else args.interval):
+                if isDiskImage(fname):
+                    pending.setdefault(fname, (None, 0.0))
+            now = time.monotonic()
+            for fname, (state, since) in list(pending.items()):
+                try:
+                    stat = os.stat(fname)
+                except OSError:
+                    del pending[fname]
+                    continue
+                current = (stat.st_size, stat.st_mtime_ns)
+                if current == finished.get(fname):
+                    del pending[fname]
+                elif current != state:
+                    pending[fname] = (current, now)
+                elif now - since >= args.settle:
+                    del pending[fname]
+                    finished[fname] = processWatchedImage(fname, args, cache, catalog, log)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        if cache is not None:
+            cache.close()
+        if catalog is not None:
+            catalog.close()
+        if log is not None:
+            log.close()
+
+# Processes a single image for watchDirectory and logs the result. Returns the image's size and modification time afterwards.
+def processWatchedImage(fname, args, cache, catalog, log):
+    try:
+        report = cache.lookup(fname) if cache is not None else None
+        for name, written, messages, entry, record, stats, mismatches in processImage(fname, args, report):
+            writeLog(log, dict(record, event='processed'))
+            if entry is not None and cache is not None:
+                cache.store(name, entry[0], entry[1], entry[2], ImageReport.fromDict(entry[3]))
+            # Images that came out of the cache unchanged don't come back with an entry, so catalog them using the cached report.
+            if catalog is not None:
+                if entry is None:
+                    stat = os.stat(name)
+                    entry = (stat.st_size, stat.st_mtime_ns, None, report.toDict())
+                catalog.store(name, entry[0], entry[1], ImageReport.fromDict(entry[3]))
+        if cache is not None:
+            cache.connection.commit()
+        if catalog is not None:
+            catalog.connection.commit()
+        stat = os.stat(fname)
+        return (stat.st_size, stat.st_mtime_ns)
+    except (OSError, ValueError) as error:
+        writeLog(log, {'event': 'error', 'image': fname, 'error': str(error)})
+        return None
+
+# Writes a record to the watch log (or to the screen if there's no log file), stamped with the time.
+def writeLog(log, record):
+    line = json.dumps(dict(record, time=time.strftime('%Y-%m-%dT%H:%M:%S%z')))
+    if log is not None:
+        log.write(line + '\n')
+        log.flush()
+    else:
+        print(line, flush=True)
 
 # Sets up argparse with all our command line arguments.
-def parse_arguments():
+def parse_arguments(argv=None):
     parser = argparse.ArgumentParser(description="A program that does pretty much everything you could possibly imagine when it comes to Lisa disk image serialization!", allow_abbrev=False)
+    parser.add_argument('paths', metavar='path', nargs='*', default=['.'], help='Disk images, directories, or glob patterns to work on. Defaults to the current directory.')
     group = parser.add_mutually_exclusive_group()
     group.add_argument('-patch', metavar='serialNumber', type=validate_positive_int, help='Patch a set of disk images to always report a fixed serial number. serialNumber must be between 0 and 16,777,215, inclusive.')
     group.add_argument('-unpatch', action='store_true', help='Unpatch a previously-patched set of disk images.')
@@ -66,8 +2813,37 @@ def parse_arguments():
     group2 = parser.add_mutually_exclusive_group()
     group2.add_argument('-setbozo', action='store_true', help='Set the bozo bits in all the disk images, enabling serialization.')
     group2.add_argument('-clearbozo', action='store_true', help='Clear the bozo bits in all the disk images, disabling serialization.')
+    parser.add_argument('-harddisk', action='store_true', help='Treat the images as hard disks with a whole LOS installation on them, and show or change the serialization and bozo bits of every tool on them instead of just one.')
+    parser.add_argument('-recursive', action='store_true', help='Also look for disk images in all the directories inside the given directories.')
+    parser.add_argument('-jobs', metavar='count', type=int, default=1, help='Process this many images at once using separate worker processes. 0 uses one worker per CPU core. Defaults to 1.')
+    parser.add_argument('-cache', metavar='cacheFile', help='Keep the analysis results for every image in this file, so that images that haven\'t changed since the last run don\'t need to be read or scanned again.')
+    parser.add_argument('-cachesize', metavar='entries', type=int, default=100000, help='The most images to keep in the analysis cache. Defaults to 100,000.')
+    parser.add_argument('-catalog', metavar='catalogFile', help='Keep an index of the serial numbers, tool numbers, disk types, and patches of every image in this file, which can be searched with -query.')
+    parser.add_argument('-query', metavar='terms', nargs='?', const='', type=parseQuery, help='Instead of working on any images, list the images in the catalog that match all of these terms, like "serial=12345" or "type=installDisk1,patched=yes". Leave the terms out to list everything.')
+    parser.add_argument('-signatures', metavar='signatureFile', action='append', default=[], help='Also recognize the SN routine variants described in this JSON file. Can be given more than once.')
+    parser.add_argument('-dedup', action='store_true', help='Find images with exactly the same contents, and only analyze and change one of each set; the rest just get the same changes.')
+    parser.add_argument('-link', choices=['hard', 'reflink'], help='With -dedup, replace changed duplicates with hard links or reflinks to the first copy instead of writing the changes to them too.')
+    parser.add_argument('-delta', metavar='directory', help='Instead of changing the images, save the changes for each one as a delta file in this directory, which can be applied later with -applydelta.')
+    parser.add_argument('-applydelta', metavar='deltaFile', action='append', default=[], help='Apply the changes in a delta file to the image that it was made for. Can be given more than once.')
+    parser.add_argument('-revertdelta', metavar='deltaFile', action='append', default=[], help='Undo the changes in a delta file on the image that it was made for. Can be given more than once.')
+    parser.add_argument('-stamp', metavar='serialNumbers', type=parseSerials, help='Make a patched copy of the images for each of these serial numbers, like "1000-1099,2000", or "@fileName" to read them from a file. Needs -stampdir.')
+    parser.add_argument('-stampdir', metavar='directory', help='With -stamp, the directory to put the copies in. Each serial number gets its own directory inside it.')
+    parser.add_argument('-overlay', metavar='destination', help='Instead of changing the images, write patched copies of them to this directory, or (for a single image) to this FIFO or to standard output with "-". The images themselves are only read.')
+    parser.add_argument('-archivedir', metavar='directory', help='Where to write the new copies of archives (.zip, .tar, .tar.gz, and so on) whose images get changed. The original archives are never changed.')
+    parser.add_argument('-watch', '--watch', metavar='directory', help='Keep running, and do whatever the other options say to every image that shows up or changes in this directory, logging the results as JSON Lines.')
+    parser.add_argument('-settle', metavar='seconds', type=float, default=2.0, help='With -watch, how long an image has to go without changing before it gets processed. Defaults to 2.')
+    parser.add_argument('-interval', metavar='seconds', type=float, default=1.0, help='With -watch, how often to look for changes on systems without inotify. Defaults to 1.')
+    parser.add_argument('-log', metavar='logFile', help='With -watch, add the results to the end of this file instead of printing them.')
+    parser.add_argument('-format', '--format', choices=['text', 'jsonl'], default='text', help='How to print the results: as colored text for people to read, or as JSON Lines with one record per image for other programs to read. Defaults to text.')
+    parser.add_argument('-profile', '--profile', action='store_true', help='Count and time what happens to every image (files opened, bytes read, scanned, and written, and so on), and print a summary at the end.')
+    parser.add_argument('-profilestats', metavar='statsFile', help='Run everything under cProfile and save the results to this file for pstats. Only covers the main process, so use it with -jobs 1.')
+    parser.add_argument('-journal', metavar='journalFile', help='Write the changes to copies of the images, noting them in this journal first, and only swap the copies in for the images in groups, once they\'re safely on disk. A crash can\'t leave an image half changed, and the batch can be undone with -rollback.')
+    parser.add_argument('-groupsize', metavar='images', type=int, default=100, help='With -journal, how many images to change between commit points. Defaults to 100.')
+    parser.add_argument('-rollback', '--rollback', metavar='journalFile', help='Undo every change in a journal made with -journal, and clean up anything that it left half done.')
+    parser.add_argument('-verify', '--verify', action='store_true', help='After changing each image, read back just the bytes that changed (including Disk Copy 4.2 checksums) and report any that don\'t match what was written.')
+    parser.add_argument('-chunksize', metavar='bytes', type=int, default=1048576, help='Images bigger than this are read and scanned this many bytes at a time instead of all at once. Defaults to 1,048,576 (1 MiB).')
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     if args.patch is not None and args.unpatch:
         parser.error("Options -patch and -unpatch can't be used together!")
@@ -75,6 +2851,57 @@ def parse_arguments():
     if args.setbozo and args.clearbozo:
         parser.error("Options -setbozo and -clearbozo can't be used together!")
 
+    if args.jobs < 0:
+        parser.error("Option -jobs can't be negative!")
+
+    if args.cachesize < 1:
+        parser.error("Option -cachesize must be at least 1!")
+
+    if args.query is not None and args.catalog is None:
+        parser.error("Option -query needs -catalog!")
+
+    if args.query is not None and (isModifying(args) or args.stamp is not None or args.watch is not None or args.applydelta or args.revertdelta):
+        parser.error("Option -query can't be used along with options that change images!")
+
+    if (args.applydelta or args.revertdelta) and isModifying(args):
+        parser.error("Options -applydelta and -revertdelta can't be used along with options that change images!")
+
+    if args.stamp is not None and (args.patch is not None or args.unpatch):
+        parser.error("Option -stamp can't be used along with -patch or -unpatch!")
+
+    if args.overlay is not None and not isModifying(args):
+        parser.error("Option -overlay needs at least one option that changes images!")
+
+    if args.overlay is not None and (args.delta is not None or args.stamp is not None or args.watch is not None or args.dedup):
+        parser.error("Option -overlay can't be used along with -delta, -stamp, -watch, or -dedup!")
+
+    if (args.stamp is None) != (args.stampdir is None):
+        parser.error("Options -stamp and -stampdir have to be used together!")
+
+    if args.watch is not None and not os.path.isdir(args.watch):
+        parser.error("Option -watch needs a directory!")
+
+    if args.settle < 0 or args.interval <= 0:
+        parser.error("Option -settle can't be negative and option -interval has to be positive!")
+
+    if args.link is not None and not args.dedup:
+        parser.error("Option -link only works along with -dedup!")
+
+    if args.journal is not None and not isModifying(args):
+        parser.error("Option -journal needs at least one option that changes images!")
+
+    if args.journal is not None and (args.delta is not None or args.link is not None or args.stamp is not None or args.overlay is not None or args.watch is not None):
+        parser.error("Option -journal can't be used along with -delta, -link, -stamp, -overlay, or -watch!")
+
+    if args.rollback is not None and (isModifying(args) or args.stamp is not None or args.watch is not None or args.query is not None or args.applydelta or args.revertdelta):
+        parser.error("Option -rollback can't be used along with options that change images!")
+
+    if args.groupsize < 1:
+        parser.error("Option -groupsize must be at least 1!")
+
+    if args.chunksize < 4096:
+        parser.error("Option -chunksize must be at least 4096!")
+
     return args
 
 # Checks that the serial number argument is an int in the proper range (up to 24 bits) and raises an exception if not.
@@ -84,515 +2911,231 @@ def validate_positive_int(value):
         raise argparse.ArgumentTypeError(f"serialNumber {value} is out of bounds! Allowed range is 0 - 16,777,215.")
     return ivalue
 
-# Parse the arguments.
-args = parse_arguments()
-
-# And then set our patch and serial number variables depending on what the user specified.
-if args.patch == None:
-    patch = False
-    serial = 0
-else:
-    patch = True
-    serial = args.patch
-
-# The other arguments are easier; just set our variables to exactly what was provided by the user.
-unpatch = args.unpatch
-removeSerial = args.deserialize
-removeBozo = args.clearbozo
-addBozo = args.setbozo
-
-# If the user elected to patch their images with a fixed serial number, we'll end up here.
-if patch:
-    # Iterate through all files in the current directory.
-    for fname in os.listdir('.'):
-        if os.path.isfile(fname):
-            # And only act on files with the extension .dc42 or .image.
-            if(fname.split('.')[len(fname.split('.')) - 1] == 'dc42' or fname.split(".")[len(fname.split('.')) - 1] == 'image'):
-                with open(fname, 'rb') as image: # Open the disk image.
-                    contents = image.read() # And read the contents.
-                    index = 0
-                    counter = 0
-                    newContents = contents # Make a copy of the contents since the original is read-only.
-                    while True:
-                        # Look for the original SN routine in our file, using the index from our previous iteration as the start point.
-                        index = newContents.find(originalRoutine, index)
-                        # If there aren't any more instances of the routine in the file, we're done.
-                        if index == -1:
-                            break
-                        # If there are, replace the routine with pre-SN patch, followed by the 24-bit SN from the user, and then the post-SN patch code.
-                        newContents = newContents[:index] + patchPreSN + serial.to_bytes(3, byteorder='big') + patchPostSN + newContents[index + len(originalRoutine):]
-                        # Increment the index to right after what we just patched.
-                        index += len(originalRoutine)
-                        counter += 1 # And increment our "patched instance" counter.
-                # If the counter is 0 after all this, we found no instances of the original SN routine. This could either mean that it's not an LOS disk, or that it's already been patched.
-                if counter == 0:
-                    # So open the file again.
-                    with open(fname, 'rb') as image:
-                        contents = image.read()
-                        index = 0
-                        # And check to see if there's a patched routine that's been patched with the exact SN that we're trying to patch with now.
-                        index = contents.find(patchPreSN + serial.to_bytes(3, byteorder='big') + patchPostSN)
-                    if index != -1: # If we end up finding such a routine, then print a message saying that it's already been patched.
-                        print(Color.BLUE + fname + ': ' + Color.GREEN + 'Already patched with serial number ' + str(serial) + '!' + Color.END)
-                    # If that still isn't the case, then there are two options left: Either it's not an LOS disk, or it's already been patched, but with a different SN.
-                    else:
-                        # So open the file once again.
-                        with open(fname, 'rb') as image:
-                            contents = image.read()
-                            index = 0
-                            counter = 0
-                            newContents = contents
-                            while True:
-                                # And look for each instance of the patched SN routine, just as we did with the original SN routine earlier.
-                                index = newContents.find(patchPreSN, index)
-                                if index == -1:
-                                    break
-                                # If we end up here, then the index was non-negative and thus a patched routine was found.
-                                oldSerial = newContents[(index + 255):(index + 258)] # So save whatever serial number the disk was previously patched with.
-                                # And then overwrite the old patch with our new patch. Really, we could just overwrite the SN part, but this is easier.
-                                newContents = newContents[:index] + patchPreSN + serial.to_bytes(3, byteorder='big') + patchPostSN + newContents[index + len(originalRoutine):]
-                                index += len(originalRoutine)
-                                counter += 1
-                        # If counter is zero, then we didn't find any occurrances of the patched routine either, meaning that this definitely isn't an LOS disk.
-                        if counter == 0:
-                            # So print a message to that effect.
-                            print(Color.BLUE + fname + ': ' + Color.RED + 'ERROR - No instances of a SN routine found. Are you sure this is an LOS disk?' + Color.END)
-                        # If counter is nonzero, then we found some patches that need their SNs updated to the new value.
-                        else:
-                            saveFile(fname) # So save the updates to the file.
-                            # And then print a message telling the user how many instances of the routine were updated, what the old serial number was, and what the updated serial number is.
-                            print(Color.BLUE + fname + ': ' + Color.GREEN + 'Updated ' + str(counter) + ' instance(s) of pre-existing patch from serial number ' + str(int.from_bytes(oldSerial, 'big')) + ' to serial number ' + str(serial) + '.' + Color.END)
-                # This is the else from all the way up in the "patch a disk with an original SN routine" section. So this gets executed if we had an original (unpatched) serial number routine on our disk.
-                else:
-                    saveFile(fname) # Save our newly-patched file.
-                    # And print a message telling the user how many instances of the routine were updated and the SN that they were updated with.
-                    print(Color.BLUE + fname + ': ' + Color.GREEN + 'Successfully patched ' + str(counter) + ' instance(s) of original SN routine with serial number ' + str(serial) + '.' + Color.END)
-
-# If the user specified the -u flag to unpatch their previously-patched images, we'll end up here.
-if unpatch:
-    # Iterate through all files in the current directory.
-    for fname in os.listdir('.'):
-        if os.path.isfile(fname):
-            # And only act on files with the extension .dc42 or .image.
-            if(fname.split('.')[len(fname.split('.')) - 1] == 'dc42' or fname.split(".")[len(fname.split('.')) - 1] == 'image'):
-                with open(fname, 'rb') as image: # Open the disk image.
-                    contents = image.read() # And read the contents.
-                    index = 0
-                    counter = 0
-                    newContents = contents # Make a copy of the contents since the original is read-only.
-                    while True:
-                        # Look for the patched SN routine in our file, using the index from our previous iteration as the start point.
-                        index = newContents.find(patchPreSN, index)
-                        # If there aren't any more instances of the routine in the file, we're done.
-                        if index == -1:
-                            break
-                        oldSerial = contents[(index + 255):(index + 258)] # If we found one, retrieve the SN that it's patched with so that we can show the user later.
-                        # And then replace the patched routine with the original routine.
-                        newContents = newContents[:index] + originalRoutine + newContents[index + len(originalRoutine):]
-                        # Increment the index to right after what we just replaced.
-                        index += len(originalRoutine)
-                        counter += 1 # And increment our "replaced instance" counter.
-                # If the counter is 0 after all this, we found no instances of the patched SN routine. This could either mean that it's not an LOS disk, or that it's already an original disk.
-                if counter == 0:
-                    # So open the file again.
-                    with open(fname, 'rb') as image:
-                        contents = image.read()
-                        index = 0
-                        # And check to see if there's already an unpatched routine on the disk.
-                        index = contents.find(originalRoutine)
-                    if index != -1: # If we end up finding such a routine, then print a message saying that it's already an original disk.
-                        print(Color.BLUE + fname + ': ' + Color.GREEN + 'Image is already unpatched!' + Color.END)
-                    # If we still don't find a routine, then it can't be an LOS disk. So tell the user.
-                    else:
-                        print(Color.BLUE + fname + ': ' + Color.RED + 'ERROR - No instances of a SN routine found. Are you sure this is an LOS disk?' + Color.END)
-                # This is the else from all the way up at the top, where we checked for instances of the patched SN routine. We'll end up here if any were found and replaced with the original routine.
-                else:
-                    saveFile(fname) # Save our newly-unpatched file.
-                    # And print a message telling the user how many instances of the routine were unpatched and the SN of patched routine that was previously there.
-                    print(Color.BLUE + fname + ': ' + Color.GREEN + 'Successfully reverted ' + str(counter) + ' instance(s) of patched SN routine, which used serial number ' + str(int.from_bytes(oldSerial, 'big')) + ', to the original routine.' + Color.END)
-
-# If the user chose to do a patching operation, as well as doing a serialization or bozoization operation, put an empty line between them for clarity.
-if (patch or unpatch) and (removeSerial or removeBozo or addBozo):
-    print()
-
-# If the user elected to deserialize, bozoize, or debozoize their image, we'll end up here.
-if removeBozo or removeSerial or addBozo:
-    # Go through all .dc42 and .image files in the directory.
-    for fname in os.listdir('.'):
-        if os.path.isfile(fname):
-            if(fname.split('.')[len(fname.split('.')) - 1] == 'dc42' or fname.split(".")[len(fname.split('.')) - 1] == 'image'):
-                # Open each file.
-                with open(fname, 'rb') as image:
-                    contents = image.read() # Read its contents.
-                    newContents = contents
-                    index = 0
-                    prevIndex = -1 # We're going to search for the last occurrance of something, so this will hold that final occurrance after index starts returning -1.
-                    lowerCaseIndex = 0 # We need to search in upper and lowercase, so this will store the index for lowercase.
-                    # Search until no more occurrances are found.
-                    while True:
-                        # Look for the next occurrance of the lowercase tool string '}obj' that comes before serialization info on a tool disk.
-                        # But only look up to index 0xA000. Any occurrances after that aren't related to serialization info.
-                        index = newContents.find(toolStringLowerCase, index)
-                        # If there are no more to find, break.
-                        if index == -1 or index > 0xA000:
-                            break
-                        # If we found one, put its location in prevIndex to prep for the next iteration.
-                        prevIndex = index
-                        # And move the index past the tool string we just found.
-                        index += len(toolStringLowerCase)
-                    # Once we're found the last occurrance before 0xA000, put its index in the lowerCaseIndex.
-                    lowerCaseIndex = prevIndex
-                    # Reset our index and prevIndex to prep for searching uppercase.
-                    index = 0
-                    prevIndex = -1
-                    # Do the same thing again, but search for '}OBJ' this time. Different tool disks use different cases here.
-                    # Once again, only search up to 0xA000.
-                    while True:
-                        index = newContents.find(toolString, index)
-                        if index == -1 or index > 0xA000:
-                            break
-                        prevIndex = index
-                        index += len(toolString)
-                    # Now make sure that at least one of these indices is positive. If neither is positive, then we didn't find either tool string, so it's probably not a tool disk.
-                    if lowerCaseIndex > -1 or prevIndex > -1:
-                        # Store whichever index is larger, the lower or uppercase one, in index. We need to do this because only the final occurrance of this tool string is the one with the serialization info.
-                        if lowerCaseIndex > prevIndex:
-                            index = lowerCaseIndex
-                        else:
-                            index = prevIndex
-                        # We're pretty sure it's a tool now, so set isTool to true.
-                        isTool = True
-                        # And decrement the index by 15 so that we can find the start of the tool number.
-                        # The full tool number is {TX}obj, where X is a number from 0 to something really big, so we were just searching for the rear end of this.
-                        # Since we don't know the size of the number, we can now just decrement the index by 15 and search for '{T' to see where the string starts.
-                        # The serial number is indexed from the start of the tool number, which is why we need to know where it is!
-                        index -= 15
-                        # So find this new starting index.
-                        # Annoyingly enough, the "T" in the tool number can be uppercase or lowercase, so search for both.
-                        # And then pick whichever index is smaller, because the smaller index will be the one that's closer to where we're searching and thus the one we want.
-                        lowerCaseIndex = contents.find(toolStringShortLowerCase, index)
-                        index = contents.find(toolStringShort, index)
-                        if((lowerCaseIndex < index and lowerCaseIndex > -1) or index == -1):
-                            index = lowerCaseIndex
-                        # And extract the 4-byte serial number that's located 65 bytes ahead of the tool string.
-                        oldSerial = newContents[(index + 65):(index + 69)]
-                        # Now grab the tool number. It's the number that starts right after "T" and ends right before "}".
-                        # Just grab the 20 bytes after the "T" and then cut it off at the "}" using the partition function and save that as a string.
-                        toolNumber = str((contents[(index + 2):(index + 22)]), 'ascii', errors='ignore').partition("}")[0]
-                        # If the user wants to deserialize, replace the serial with all 0's.
-                        if removeSerial:
-                            newContents = newContents[:index + 65] + bytes('\x00\x00\x00\x00', 'ascii') + newContents[(index + 69):]
-                        # The bozo bits are 71 bytes ahead of the tool string, so save their state too for future use. A in the first or both bytes means it's off and ones in both means it's on.
-                        if(newContents[index + 71] == 0x00):
-                            oldBozo = False
-                        elif(newContents[index + 71] == 0x01 and newContents[index + 72] == 0x01):
-                            oldBozo = True
-                        else:
-                            oldBozo = False
-                        # If the user wants to clear the bozo bits, set them to 0.
-                        if removeBozo:
-                            newContents = newContents[:(index + 71)] + bytes('\x00', 'ascii') + newContents[(index + 72):]
-                        # And if they want to set them, then set them to 1.
-                        if addBozo:
-                            newContents = newContents[:(index + 71)] + bytes('\x01\x01', 'ascii') + newContents[(index + 73):]
-                    # If neither of the indices from earlier were positive, then this isn't a tool disk.
-                    else:
-                        isTool = False
-                    # It's also not a tool disk if it has any of the strings "Office System 1" through "Office System 5" anywhere in it.
-                    # In that case, it's an OS installer disk. Some of the OS installers have tool strings that will confuse the above code, which is why we need this check!
-                    if contents.find(officeOther + bytes('1', 'ascii')) > -1 or contents.find(officeOther + bytes('2', 'ascii')) > -1 or contents.find(officeOther + bytes('3', 'ascii')) > -1 or contents.find(officeOther + bytes('4', 'ascii')) > -1 or contents.find(officeOther + bytes('5', 'ascii')) > -1:
-                        isTool = False
-                # If it is in fact a tool disk, save any changes we made and print the appropriate messages out to the user.
-                if isTool:
-                    print(Color.BLUE + fname + ': ' + Color.END, end='')
-                    # A special case of a tool disk that doesn't have valid serialization info is the LisaWrite 2 disk.
-                    # It's just the dictionary, so check if another tool string follows soon (within 130 bytes) after the last one we found.
-                    # If so, then it's definitely the LisaWrite 2 disk, so just tell the user and don't try to save any serialization changes to disk.
-                    # Normal disks normally have several hunder bytes in between tool strings.
-                    # Note that these tool strings that come after don't end in }obj since we would've found them already as the last string if they did!
-                    if contents.find(toolStringShort, index + len(toolStringShort)) - index < 130:
-                        print(Color.GREEN + 'There are no serialization features on the LisaWrite 2 (tool #' + toolNumber + ') disk, so nothing to do here.' + Color.END, end='')
-                    else:
-                        if int.from_bytes(oldSerial, 'big') == 0 and removeSerial:
-                            print(Color.GREEN + 'Tool #' + toolNumber + ' already deserialized! ' + Color.END, end='')
-                        elif int.from_bytes(oldSerial, 'big') > 0 and removeSerial:
-                            saveFile(fname)
-                            print(Color.GREEN + 'Tool #' + toolNumber + ' deserialized; previously serialized with SN ' + str(int.from_bytes(oldSerial, 'big')) + '. ' + Color.END, end='')
-                        if addBozo and oldBozo == True:
-                            print(Color.GREEN + 'Tool #' + toolNumber + "'s bozo bits already set, so nothing to do here!" + Color.END, end='')
-                        elif addBozo:
-                            saveFile(fname)
-                            print(Color.GREEN + 'Tool #' + toolNumber + "'s bozo bits set!" + Color.END, end='')
-                        if removeBozo and oldBozo == False:
-                            print(Color.GREEN + 'Tool #' + toolNumber + "'s bozo bits already cleared, so nothing to do here!" + Color.END, end='')
-                        elif removeBozo:
-                            saveFile(fname)
-                            print(Color.GREEN + 'Tool #' + toolNumber + "'s bozo bits cleared!" + Color.END, end='')
-                    print()
-                # If it's not a tool disk, then it's either an OS installer or a non-LOS disk.
-                else:
-                    # Reopen the image and read it into a variable.
-                    with open(fname, 'rb') as image:
-                        contents = image.read()
-                        newContents = contents
-                        index = 0
-                        # Search for strings in the file.
-                        while True:
-                            # Look for the string "Office System 1".
-                            # The Office System 1 disk is the only one of the installers that records the serial number.
-                            index = newContents.find(officeString, index)
-                            # If we find it between 0x3000 and 0x4000, then break.
-                            # We want to ensure that we found the particular occurrance that's between these addresses since that's the only one that contains serialization.
-                            if index > 0x3000 and index < 0x4000:
-                                break
-                            # And if it's not found at all, then also break.
-                            if index == -1:
-                                break
-                            # Otherwise, increment the index by the length of the string to keep looking.
-                            index += len(officeString)
-                        # If we ended up getting a positive index, then it must be in our 0x3000-0x4000 range.
-                        if index > -1:
-                            # We know that this is an OS installer disk now.
-                            isOfficeSystem = True
-                            # Grab the 4-byte serial number, which is 191 bytes ahead of the start of the string.
-                            oldSerial = contents[(index + 191):(index + 195)]
-                            # If the user wants to deserialize, then replace this number with all 0's.
-                            if removeSerial:
-                                newContents = newContents[:index + 191] + bytes('\x00\x00\x00\x00', 'ascii') + newContents[(index + 195):]
-                        # If the Office System 1 string wasn't found, then it's either another one of the OS installer disks or a non-LOS disk.
-                        else:
-                            # So set isOfficeSystem to false to say that it's not the Office System 1 disk.
-                            isOfficeSystem = False
-                            index = 0
-                            # And search for the simple string "Office System" between 0x3000 and 0x4000.
-                            while True:
-                                index = newContents.find(officeOther, index)
-                                if index > 0x3000 and index < 0x4000:
-                                    break
-                                if index == -1:
-                                    break
-                                index += len(officeOther)
-                            # If we found it, then this is one of the other OS installer disks.
-                            if index > -1:
-                                isOtherOffice = True
-                            # And if not, then it's not a tool or OS disk.
-                            else:
-                                isOtherOffice = False
-                    # If it's the Office System 1 disk, save any changes that the user requested to disk and print out the appropriate messages.
-                    # The installers have no bozo bits; only a serial number.
-                    if isOfficeSystem:
-                        print(Color.BLUE + fname + ': ' + Color.END, end='')
-                        if int.from_bytes(oldSerial, 'big') == 0 and removeSerial:
-                            print(Color.GREEN + 'LOS installer already deserialized! ' + Color.END, end='')
-                        elif int.from_bytes(oldSerial, 'big') > 0 and removeSerial:
-                            saveFile(fname)
-                            print(Color.GREEN + 'LOS install disk 1 deserialized; previously serialized with SN ' + str(int.from_bytes(oldSerial, 'big')) + '. ' + Color.END, end='')
-                        if addBozo:
-                            print(Color.GREEN + 'No bozo bits to set on LOS install disks.' + Color.END, end='')
-                        elif removeBozo:
-                            print(Color.GREEN + 'No bozo bits to clear on LOS install disks.'+ Color.END, end='')
-                        print()
-                    # If it's one of the other installer disks, just print a message saying that there's nothing to do here.
-                    elif isOtherOffice:
-                        print(Color.BLUE + fname + ': ' + Color.END, end='')
-                        if removeSerial and not removeBozo and not addBozo:
-                            print(Color.GREEN + 'Nothing to deserialize on LOS install disks 2 and onward.' + Color.END)
-                        if removeSerial and removeBozo:
-                            print(Color.GREEN + 'Nothing to deserialize or debozoize on LOS install disks 2 and onward.' + Color.END)
-                        if removeSerial and addBozo:
-                            print(Color.GREEN + 'Nothing to deserialize or bozoize on LOS install disks 2 and onward.' + Color.END)
-                        if not removeSerial and addBozo:
-                            print(Color.GREEN + 'No bozo bits to set on LOS install disks.' + Color.END)
-                        if not removeSerial and removeBozo:
-                            print(Color.GREEN + 'No bozo bits to clear on LOS install disks.' + Color.END)
-                    # If it's not a tool or OS disk, then it's either LisaGuide or a bad disk.
-                    else:
-                        # Look for the text "LisaGuide" between indices 0x0000 and 0xE000. If found, it's LisaGuide, so there's nothing to do and we're good.
-                        if newContents.find(lisaGuide) < 0xE000 and newContents.find(lisaGuide) > 0x0000:
-                            print(Color.BLUE + fname + ': ' + Color.GREEN + 'Nothing to ' + Color.END, end='')
-                            if removeSerial and not removeBozo and not addBozo:
-                                print(Color.GREEN + 'deserialize ', end='')
-                            if removeSerial and removeBozo:
-                                print(Color.GREEN + 'deserialize or debozoize ', end='')
-                            if removeSerial and addBozo:
-                                print(Color.GREEN + 'deserialize or bozoize ', end='')
-                            if not removeSerial and removeBozo:
-                                print(Color.GREEN + 'debozoize ', end='')
-                            if not removeSerial and addBozo:
-                                print(Color.GREEN + 'bozize ', end='')
-                            print(Color.GREEN + 'on the LisaGuide disk.' + Color.END)
-                        # If we don't find that text, then this probably isn't a Lisa install/tool disk.
-                        else:
-                            print(Color.BLUE + fname + ': ' + Color.RED + 'ERROR - Unable to find anything to ' + Color.END, end='')
-                            if removeSerial and not removeBozo and not addBozo:
-                                print(Color.RED + 'deserialize.', end='')
-                            if removeSerial and removeBozo:
-                                print(Color.RED + 'deserialize or debozoize.', end='')
-                            if removeSerial and addBozo:
-                                print(Color.RED + 'deserialize or bozoize.', end='')
-                            if not removeSerial and removeBozo:
-                                print(Color.RED + 'debozoize.', end='')
-                            if not removeSerial and addBozo:
-                                print(Color.RED + 'bozize.', end='')
-                            print(' Are you sure this is an LOS intaller or tool disk?' + Color.END)
-
-
-# If no arguments were given, then we just want to provide info about the disk images in the directory without changing anything.
-if not patch and not unpatch and not removeSerial and not removeBozo and not addBozo:
-    # Once again, go through all files in the directory that have a .dc42 or .image extension.
-    for fname in os.listdir('.'):
-        if os.path.isfile(fname):
-            if(fname.split('.')[len(fname.split('.')) - 1] == 'dc42' or fname.split(".")[len(fname.split('.')) - 1] == 'image'):
-                # Open the file.
-                with open(fname, 'rb') as image:
-                    # And read its contents.
-                    contents = image.read()
-                    index = 0
-                    # Search for an instance of the original (unpatched) serial number routine.
-                    index = contents.find(originalRoutine)
-                # If found, tell the user that this disk is not patched.
-                if index > -1:
-                    print(Color.BLUE + fname + ': ' + Color.YELLOW + 'Image is not patched. ' + Color.END, end='')
-                # If no routine is found, then it's either unpatched or not a Lisa disk at all.
-                else:
-                    # Reopen the image.
-                    with open(fname, 'rb') as image:
-                        contents = image.read()
-                        index = 0
-                        # And search for the patch.
-                        index = contents.find(patchPreSN)
-                        # If found, tell the user it's patched as well as the serial number that we're patched with.
-                        if index > -1:
-                            oldSerial = contents[(index + 255):(index + 258)]
-                            print(Color.BLUE + fname + ': ' + Color.GREEN + 'Patched with SN ' + str(int.from_bytes(oldSerial, 'big')) + '. ' + Color.END, end='')
-                        # If not, then it's not an LOS disk, so tell the user.
-                        else:
-                            print(Color.BLUE + fname + ': ' + Color.RED + 'No instances of a SN routine found. Are you sure this is an LOS disk? ' + Color.END, end='')
-                # Now check serialization and bozo bits status.
-                with open(fname, 'rb') as image:
-                    contents = image.read()
-                    index = 0
-                    prevIndex = -1
-                    lowerCaseIndex = 0
-                    # Find the last occurrance of the lowercase tool string, as done earlier in the deserialization section.
-                    while True:
-                        index = contents.find(toolStringLowerCase, index)
-                        if index == -1 or index > 0xA000:
-                            break
-                        prevIndex = index
-                        index += len(toolStringLowerCase)
-                    lowerCaseIndex = prevIndex
-                    index = 0
-                    prevIndex = -1
-                    # And do the same for the last occurrance of the uppercase tool string.
-                    while True:
-                        index = contents.find(toolString, index)
-                        if index == -1 or index > 0xA000:
-                            break
-                        prevIndex = index
-                        index += len(toolString)
-                    # If either tool string index is positive, then we found a tool string, and this is probably a tool disk.
-                    if lowerCaseIndex > -1 or prevIndex > -1:
-                        # Pick whichever string index is larger, the lowercase or uppercase one, and put that in index.
-                        if lowerCaseIndex > prevIndex:
-                            index = lowerCaseIndex
-                        else:
-                            index = prevIndex
-                        # We're pretty sure this is a tool, so set isTool to true.
-                        isTool = True
-                        # Decrement the index by 15 and search for the start of the tool string. More detail and the rationale for this is given in the deserialization section.
-                        index -= 15
-                        # Search for both upper and lowercase versions of this string and pick whichever index is smaller.
-                        lowerCaseIndex = contents.find(toolStringShortLowerCase, index)
-                        index = contents.find(toolStringShort, index)
-                        if((lowerCaseIndex < index and lowerCaseIndex > -1) or index == -1):
-                            index = lowerCaseIndex
-                        # Grab the serial number that the tool has been serialized to.
-                        oldSerial = contents[(index + 65):(index + 69)]
-                        # As well as the status of the tool's bozo bits.
-                        if(contents[index + 71] == 0x00):
-                            oldBozo = False
-                        elif(contents[index + 71] == 0x01 and contents[index + 72] == 0x01):
-                            oldBozo = True
-                        else:
-                            oldBozo = False
-                        # Now grab the tool number. It's the number that starts right after "T" and ends right before "}".
-                        # Just grab the 20 bytes after the "T" and then cut it off at the "}" using the partition function and save that as a string.
-                        toolNumber = str((contents[(index + 2):(index + 22)]), 'ascii', errors='ignore').partition("}")[0]
-                    # If we didn't find any occurrances of the tool string, then this isn't a tool disk.
-                    else:
-                        isTool = False
-                    # If we find any of the strings "Office System 1" through "Office System 5", then it's an OS installer disk.
-                    # Some of these disks have tool strings, but they aren't tools, so set isTool accordingly.
-                    if contents.find(officeOther + bytes('1', 'ascii')) > -1 or contents.find(officeOther + bytes('2', 'ascii')) > -1 or contents.find(officeOther + bytes('3', 'ascii')) > -1 or contents.find(officeOther + bytes('4', 'ascii')) > -1 or contents.find(officeOther + bytes('5', 'ascii')) > -1:
-                        isTool = False
-                # If it's a tool, tell the user its serialization and bozoization status.
-                if isTool:
-                    # Account for the special case for the LisaWrite 2 disk, as described in the deserialization section.
-                    if contents.find(toolStringShort, index + len(toolStringShort)) - index < 130:
-                        print(Color.GREEN + 'No serialization or bozo bits on the LisaWrite 2 (tool #' + toolNumber + ') disk.' + Color.END, end='')
-                    else:
-                        if int.from_bytes(oldSerial, 'big') == 0:
-                            print(Color.GREEN + 'Tool #' + toolNumber + ' deserialized' + Color.END, end='')
-                        elif int.from_bytes(oldSerial, 'big') > 0:
-                            print(Color.YELLOW + 'Tool #' + toolNumber + ' serialized with SN ' + str(int.from_bytes(oldSerial, 'big')) + Color.END, end='')
-                        if oldBozo == True:
-                            print(Color.YELLOW + ' and bozo bits are set.' + Color.END, end='')
-                        elif oldBozo == False:
-                            print(Color.GREEN + ' and bozo bits are cleared.' + Color.END, end='')
-                # If it's not a tool, then it might be an OS installer. Or maybe it's neither.
-                else:
-                    # Reopen the image.
-                    with open(fname, 'rb') as image:
-                        contents = image.read()
-                        index = 0
-                        # And search for the string "Office System 1", as described in the deserialization section.
-                        # Only the first installer disk is serialized.
-                        while True:
-                            index = contents.find(officeString, index)
-                            if index > 0x3000 and index < 0x4000:
-                                break
-                            if index == -1:
-                                break
-                            index += len(officeString)
-                        # If we find this, then it's definitely an installer disk, so grab the serial number.
-                        if index > -1:
-                            isOfficeSystem = True
-                            oldSerial = contents[(index + 191):(index + 195)]
-                        # If not, then it might be one of the other four install disks.
-                        else:
-                            isOfficeSystem = False
-                            index = 0
-                            # So check for the simple string "Office System".
-                            while True:
-                                index = contents.find(officeOther, index)
-                                if index > 0x3000 and index < 0x4000:
-                                    break
-                                if index == -1:
-                                    break
-                                index += len(officeOther)
-                            # If we find it in the desired range, then it's one of the other installer disks.
-                            if index > -1:
-                                isOtherOffice = True
-                            # If not, then this isn't a tool or OS install disk.
-                            else:
-                                isOtherOffice = False
-                    # If it's install disk 1, then give the user the appropriate serialization info.
-                    if isOfficeSystem:
-                        if int.from_bytes(oldSerial, 'big') == 0:
-                            print(Color.GREEN + 'LOS install is deserialized. ' + Color.END, end='')
-                        elif int.from_bytes(oldSerial, 'big') > 0:
-                            print(Color.YELLOW + 'Serialized with SN ' + str(int.from_bytes(oldSerial, 'big')) + '. ' + Color.END, end='')
-                        print(Color.GREEN + 'No bozo bits on LOS install disk 1.' + Color.END, end='')
-                    # If it's one of the other install disks, tell the user that there's no info to give.
-                    elif isOtherOffice:
-                        print(Color.GREEN + 'No serialization or bozo bits on LOS install disks 2 and onward.' + Color.END, end='')
-                    # If it's not an OS installer or a tool, it's either LisaGuide or something else random.
-                    else:
-                        # Look for the "LisaGuide" text between 0x0000 and 0xE000. If so, it's LisaGuide, and there's no serialization or bozo bits to worry about.
-                        if contents.find(lisaGuide) < 0xE000 and contents.find(lisaGuide) > 0x0000:
-                            print(Color.GREEN + 'No serialization or bozo bits on the LisaGuide disk.' + Color.END, end='')
-                        # If not, then this isn't an LOS tool/installer, so tell the user.
-                        else:
-                            print(Color.RED + 'Unable to find any serialization or bozo bit info. Are you sure this is an LOS installer or tool disk?' + Color.END, end='')
-                print()
+# Prints the totals of every image's profile for -profile, along with the images that took the longest.
+# The phases only add up the time spent on the images themselves, so with more than one job, they can add up to more than the time that the whole batch took.
+def printProfile(profiles, seconds, outputFormat):
+    phases = {name: sum([stats['seconds'][name] for fname, stats in profiles]) for name in profilePhases}
+    counters = {name: sum([stats['counters'][name] for fname, stats in profiles]) for name in profileCounters}
+    slowest = sorted(profiles, key=lambda item: -sum(item[1]['seconds'].values()))[:10]
+    slowest = [(fname, round(sum(stats['seconds'].values()), 6)) for fname, stats in slowest]
+    if outputFormat == 'jsonl':
+        print(json.dumps({'profile': {'images': len(profiles), 'seconds': round(seconds, 6), 'phases': {name: round(value, 6) for name, value in phases.items()}, 'counters': counters, 'slowest': [{'image': fname, 'seconds': total} for fname, total in slowest]}}), flush=True)
+        return
+    print(Color.BOLD + 'Profile of ' + str(len(profiles)) + ' image(s), which took ' + f'{seconds:.3f}' + ' second(s) in all:' + Color.END)
+    print('phase            seconds   per image')
+    for name in profilePhases:
+        print(name.ljust(12) + f'{phases[name]:>12.3f}{phases[name] / max(1, len(profiles)):>12.6f}')
+    print('counter            total   per image')
+    for name in profileCounters:
+        print(name.ljust(12) + f'{counters[name]:>12}{counters[name] / max(1, len(profiles)):>12.1f}')
+    if slowest:
+        print('slowest images     seconds')
+        for fname, total in slowest:
+            print(f'{total:>26.6f}  ' + fname)
+
+# Prints a summary of how verification went, listing every image that failed it so that they don't get lost among the rest of the messages.
+def printVerification(verified):
+    failed = [fname for fname, mismatches in verified if mismatches]
+    if not failed:
+        print(Color.GREEN + 'Verified the changes to all ' + str(len(verified)) + ' image(s).' + Color.END)
+        return
+    print(Color.RED + 'ERROR - The changes to ' + str(len(failed)) + ' of ' + str(len(verified)) + ' image(s) failed verification:' + Color.END)
+    for fname in failed:
+        print(Color.RED + '    ' + fname + Color.END)
+
+# Prints the result for an image: its record if we're writing JSON Lines, or its messages otherwise.
+# Each record gets printed as soon as its image is done, so that whatever is reading them can get started on them right away.
+def printResult(messages, record):
+    if record is not None:
+        print(json.dumps(record), flush=True)
+    else:
+        for message in messages:
+            print(message)
+
+# Runs the command line tool. argv is the list of arguments to use instead of the ones from the command line, if any.
+# With -profilestats, the whole run happens under cProfile, and the results get saved for pstats to read afterwards.
+def main(argv=None):
+    # Parse the arguments.
+    args = parse_arguments(argv)
+    if args.profilestats is None:
+        run(args)
+        return
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        profiler.runcall(run, args)
+    finally:
+        profiler.dump_stats(args.profilestats)
+
+# Does whatever the parsed command line arguments ask for.
+def run(args):
+    startTime = time.perf_counter()
+
+    # If we were given a journal to roll back, that's all we need to do.
+    if args.rollback is not None:
+        try:
+            results = rollbackJournal(args.rollback, args)
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            fname, written, messages, entry, record, stats, mismatches = rollbackResult(args.rollback, None, args, Color.BLUE + args.rollback + ': ' + Color.RED + 'ERROR - Unable to use this journal: ' + str(error) + Color.END, error=str(error))
+            printResult(messages, record)
+            return
+        for fname, written, messages, entry, record, stats, mismatches in results:
+            printResult(messages, record)
+        if args.format == 'text':
+            print('Rolled back the changes to ' + str(len(set([result[0] for result in results if result[1] > 0]))) + ' image(s) from ' + args.rollback + ', writing ' + str(sum([result[1] for result in results])) + ' byte(s).')
+        return
+
+    # If we were given deltas to apply or revert, that's all we need to do.
+    if args.applydelta or args.revertdelta:
+        written = 0
+        verified = []
+        for path, revert in [(path, False) for path in args.applydelta] + [(path, True) for path in args.revertdelta]:
+            fname, deltaWritten, messages, entry, record, stats, mismatches = applyDeltaFile(path, revert, args)
+            printResult(messages, record)
+            written += deltaWritten
+            if mismatches is not None:
+                verified.append((path, mismatches))
+        if args.format == 'text':
+            print('Wrote ' + str(written) + ' byte(s).')
+            if verified:
+                printVerification(verified)
+        return
+
+    # Load any extra routine signatures before anything gets analyzed.
+    for path in args.signatures:
+        try:
+            loadSignatures(path)
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            print(Color.BLUE + path + ': ' + Color.RED + 'ERROR - Unable to load routine signatures: ' + str(error) + Color.END)
+            return
+
+    # Catalog queries don't need to look at any images at all.
+    if args.query is not None:
+        queryCatalog(args)
+        return
+
+    # In watch mode, we keep going until we're stopped.
+    if args.watch is not None:
+        watchDirectory(args)
+        return
+
+    # Find all the .dc42 and .image files that the user pointed us at.
+    # Any archives that were named outright get their images read straight out of them later on, after all the loose images.
+    images = collectImages(args.paths, args.recursive)
+    archives = [fname for fname in images if isArchive(fname)]
+    images = [fname for fname in images if not isArchive(fname)]
+
+    # If we're making overlays, the images are only ever read.
+    if args.overlay is not None:
+        for archive in archives:
+            print(Color.BLUE + archive + ': ' + Color.RED + "ERROR - Images inside archives can't be used with -overlay." + Color.END)
+        exportOverlays(images, args)
+        return
+
+    # If we're stamping, the images are just the templates for the copies.
+    if args.stamp is not None:
+        for archive in archives:
+            print(Color.BLUE + archive + ': ' + Color.RED + "ERROR - Images inside archives can't be used for stamping." + Color.END)
+        stampImages(images, args)
+        return
+
+    # If we're deduplicating, sort the images into groups with the same contents. Otherwise, every image is on its own.
+    if args.dedup:
+        groups = groupDuplicates(images, args.chunksize)
+    else:
+        groups = [[fname] for fname in images]
+
+    # If we're using the analysis cache, look up every image that hasn't changed since the last run.
+    # Each group only needs the report for the image that actually gets processed.
+    cache = None
+    reports = [None] * len(groups)
+    if args.cache is not None:
+        cache = AnalysisCache(args.cache, args.cachesize)
+        reports = [cache.lookup(group[0]) for group in groups]
+
+    # If we're keeping the catalog, it knows about every image that hasn't changed since it was last cataloged too.
+    # Those images don't need to be cataloged again, and if the cache didn't have their reports, the catalog's can be used instead.
+    catalog = None
+    cataloged = {}
+    if args.catalog is not None:
+        catalog = SerialCatalog(args.catalog)
+        cataloged = {fname: catalog.lookup(fname) for fname in images}
+        reports = [report if report is not None else cataloged[group[0]] for group, report in zip(groups, reports)]
+    knownReports = {fname: report for group, report in zip(groups, reports) for fname in group}
+
+    # If we're journaling, the changed images get swapped in a group at a time as their results come back.
+    journal = None
+    if args.journal is not None:
+        journal = WriteJournal(args.journal, args.groupsize)
+
+    # Now do whatever the user asked for to each image.
+    # The results for duplicates come back along with the first image in their group, so hold on to them until it's their turn to be printed.
+    written = 0
+    modified = 0
+    waiting = {}
+    position = 0
+    profiles = []
+    verified = []
+    # Whatever happens partway through, the images that are already done still get committed, and the cache and the catalog still get saved.
+    try:
+        for results in runBatch(groups, args, reports):
+            for result in results:
+                waiting[result[0]] = result
+            while position < len(images) and images[position] in waiting:
+                fname, imageWritten, messages, entry, record, stats, mismatches = waiting.pop(images[position])
+                position += 1
+                printResult(messages, record)
+                if stats is not None:
+                    profiles.append((fname, stats))
+                if mismatches is not None:
+                    verified.append((fname, mismatches))
+                written += imageWritten
+                if imageWritten > 0:
+                    modified += 1
+                    if journal is not None:
+                        journal.add(fname)
+                # Save anything new that we learned about the image back to the cache and the catalog.
+                if entry is not None and cache is not None:
+                    cache.store(fname, entry[0], entry[1], entry[2], ImageReport.fromDict(entry[3]))
+                if catalog is not None:
+                    if entry is not None:
+                        catalog.store(fname, entry[0], entry[1], ImageReport.fromDict(entry[3]))
+                    elif cataloged[fname] is None:
+                        stat = os.stat(fname)
+                        catalog.store(fname, stat.st_size, stat.st_mtime_ns, knownReports[fname])
+
+        # Then go through the images inside each archive.
+        for archive in archives:
+            for fname, imageWritten, messages, entry, record, stats, mismatches in processArchive(archive, args):
+                printResult(messages, record)
+                if stats is not None:
+                    profiles.append((fname, stats))
+                written += imageWritten
+                if imageWritten > 0:
+                    modified += 1
+        if catalog is not None:
+            catalog.prune([path for path in args.paths if os.path.isdir(path)])
+    finally:
+        if journal is not None:
+            journal.close()
+        if cache is not None:
+            cache.close()
+        if catalog is not None:
+            catalog.close()
+
+    # If we changed anything, tell the user how much we actually had to write.
+    if modified > 0 and args.format == 'text' and args.delta is not None:
+        print('Saved deltas changing ' + str(written) + ' byte(s) in ' + str(modified) + ' image(s) to ' + args.delta + '.')
+    elif modified > 0 and args.format == 'text':
+        print('Wrote ' + str(written) + ' byte(s) to ' + str(modified) + ' image(s).')
+    if journal is not None and journal.commits > 0 and args.format == 'text':
+        print('Committed the changes to ' + str(journal.committed) + ' image(s) in ' + str(journal.commits) + ' group(s), journaled in ' + args.journal + '.')
+    if verified and args.format == 'text':
+        printVerification(verified)
+
+    if args.profile:
+        printProfile(profiles, time.perf_counter() - startTime, args.format)
+
+# Only run when we're started as a script, so that the worker processes can import us without kicking off another batch.
+if __name__ == '__main__':
+    main()